@@ -1,439 +1,182 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from utils.excel_parser import parse_excel
+import time
+STARTUP_START = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context, g
+from utils.lazy_imports import LazyImporter
+from utils.tag_formats import EXPORT_FORMATS, default_export_format
+from utils.tag_cache import ParsedTagCache
+from utils.upload_store import UploadStore, UploadTooLarge
+from utils.tag_index import UniqueNameAllocator
+from utils.tag_store import PartitionedTagIndex
+from utils.retrieval import select_prompt_variables
+from utils.response_cache import ResponseCache, make_cache_key
 from utils.st_generator import generate_declarations, build_prompt_user_only
-import google.generativeai as genai
-from config import MODEL
-import os
-import pandas as pd
+from utils.llm_client import ModelClient, create_backend
+from utils.session_store import create_session_store, new_session_id, valid_session_id
+from utils.report_jobs import ReportJobQueue
+from utils.metrics import MetricsRegistry, Trace
+from utils.st_parser import STParser, parse_st, declared_variables
+from utils.st_checker import STChecker
+from utils.st_repair import (extract_code, find_repair_issues, add_declarations, build_repair_prompt,
+                             apply_repair)
+from config import (MODEL, GEMINI_API_KEY, LLM_BACKEND, MOCK_LLM_LATENCY, MOCK_LLM_STREAM_CHUNKS,
+                    UPLOAD_DIR, UPLOAD_MAX_BYTES, UPLOAD_CHUNK_BYTES,
+                    TAG_CACHE_DIR, TAG_CACHE_MAX_BYTES,
+                    RETRIEVAL_TOP_K, RETRIEVAL_TOKEN_BUDGET,
+                    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DB,
+                    LLM_MAX_CONCURRENCY, LLM_TIMEOUT, LLM_MAX_RETRIES,
+                    LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_QUEUE_TIMEOUT,
+                    SESSION_BACKEND, SESSION_DB, SESSION_IDLE_TTL, SESSION_MAX,
+                    REPORT_DIR, REPORT_WORKERS, REPORT_JOB_TTL, REPORT_SPOOL_MAX_BYTES,
+                    REPORT_MAX_MESSAGE_CHARS, REPORT_MESSAGE_APPENDIX, REPORT_TABLE_CHUNK_ROWS,
+                    BATCH_MAX_CONCURRENCY, BATCH_MAX_ITEMS, PRELOAD_SUBSYSTEMS,
+                    METRICS_SERVER_TIMING, ST_CHECK_CACHE_SIZE, REPAIR_MAX_ATTEMPTS, REPAIR_DEADLINE)
+import json
 import re
+import io
+from concurrent.futures import ThreadPoolExecutor
 
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-from reportlab.platypus.tableofcontents import TableOfContents
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Preformatted
-import textwrap
-import tempfile
 from datetime import datetime
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = "Uploads"
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-user_variables = []
-uploaded_variables = []
-last_context = []
-
-def generate_session_report_pdf(session_data):
-    """
-    Generate a comprehensive PDF document for PLC code generation session
-    
-    session_data should contain:
-    - operator_name: str
-    - session_start_time: datetime
-    - session_end_time: datetime
-    - chat_history: list of messages
-    - generated_code: dict with 'vars' and 'logic'
-    - retrieved_context: list of variables
-    - mode: str ('excel' or 'user')
-    - clarification_summary: str
-    """
-    
-    # Create temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-    
-    # Create PDF document
-    doc = SimpleDocTemplate(
-        temp_file.name,
-        pagesize=A4,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=18
-    )
-    
-    # Get styles and create custom styles
-    styles = getSampleStyleSheet()
-    custom_styles = create_custom_styles(styles)
-    
-    # Build document content
-    story = []
-    
-    # Add header section
-    add_pdf_header_section(story, session_data, custom_styles)
-    
-    # Add session overview
-    add_pdf_session_overview(story, session_data, custom_styles)
-    
-    # Add chat history
-    add_pdf_chat_history_section(story, session_data, custom_styles)
-    
-    # Add generated code
-    add_pdf_generated_code_section(story, session_data, custom_styles)
-    
-    # Add retrieved context
-    add_pdf_retrieved_context_section(story, session_data, custom_styles)
-    
-    # Add clarification summary
-    add_pdf_clarification_section(story, session_data, custom_styles)
-    
-    # Add footer info
-    add_pdf_footer_section(story, custom_styles)
-    
-    # Build PDF
-    doc.build(story)
-    
-    return temp_file.name
-
-def create_custom_styles(base_styles):
-    """Create custom styles for the PDF"""
-    custom_styles = {}
-    
-    # Title style
-    custom_styles['title'] = ParagraphStyle(
-        'CustomTitle',
-        parent=base_styles['Heading1'],
-        fontSize=18,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#1a365d')
-    )
-    
-    # Heading style
-    custom_styles['heading'] = ParagraphStyle(
-        'CustomHeading',
-        parent=base_styles['Heading2'],
-        fontSize=14,
-        spaceBefore=20,
-        spaceAfter=12,
-        textColor=colors.HexColor('#2d3748')
-    )
-    
-    # Subheading style
-    custom_styles['subheading'] = ParagraphStyle(
-        'CustomSubheading',
-        parent=base_styles['Heading3'],
-        fontSize=12,
-        spaceBefore=15,
-        spaceAfter=8,
-        textColor=colors.HexColor('#4a5568')
-    )
-    
-    # Code style
-    custom_styles['code'] = ParagraphStyle(
-    'CodeStyle',
-    parent=base_styles['Code'],
-    fontSize=9,
-    leftIndent=20,
-    fontName='Courier',
-    backColor=colors.HexColor('#f7fafc'),
-    borderColor=colors.HexColor('#e2e8f0'),
-    borderWidth=1,
-    borderPadding=8,
-    spaceBefore=6,
-    spaceAfter=6,
-    alignment=TA_LEFT,
-    wordWrap='LTR'  # Add word wrap control
-)
-    
-    # Normal text
-    custom_styles['normal'] = ParagraphStyle(
-        'CustomNormal',
-        parent=base_styles['Normal'],
-        fontSize=10,
-        spaceAfter=6
-    )
-    
-    # Chat styles
-    custom_styles['chat_user'] = ParagraphStyle(
-        'ChatUser',
-        parent=base_styles['Normal'],
-        fontSize=9,
-        leftIndent=20,
-        backColor=colors.HexColor('#e6f3ff'),
-        borderColor=colors.HexColor('#3182ce'),
-        borderWidth=1,
-        borderPadding=5
-    )
-    
-    custom_styles['chat_bot'] = ParagraphStyle(
-        'ChatBot',
-        parent=base_styles['Normal'],
-        fontSize=9,
-        leftIndent=20,
-        backColor=colors.HexColor('#f0fff4'),
-        borderColor=colors.HexColor('#38a169'),
-        borderWidth=1,
-        borderPadding=5
-    )
-    
-    return custom_styles
+# Heavy subsystems are imported on first use to keep worker start-up fast
+lazy = LazyImporter({
+    "tag_parsing": "utils.excel_parser",
+    "tag_delta": "utils.tag_delta",
+    "reports": "utils.pdf_report",
+    "dataframes": "pandas",
+    "model_sdk": "google.generativeai"
+})
+app.config['UPLOAD_FOLDER'] = UPLOAD_DIR
+# Leave headroom for multipart framing; the upload store enforces the exact file limit
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES + 64 * 1024
+
+upload_store = UploadStore(UPLOAD_DIR, UPLOAD_MAX_BYTES, UPLOAD_CHUNK_BYTES)
+tag_cache = ParsedTagCache(TAG_CACHE_DIR, TAG_CACHE_MAX_BYTES)
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DB)
+st_checker = STChecker(ST_CHECK_CACHE_SIZE)
+
+def make_backend():
+    """Build the configured LLM backend (called once, on first model use)"""
+    if LLM_BACKEND == "mock":
+        return create_backend("mock", "mock", latency=MOCK_LLM_LATENCY,
+                              stream_chunks=MOCK_LLM_STREAM_CHUNKS)
+    if LLM_BACKEND == "gemini":
+        lazy.load("model_sdk")
+    return create_backend(LLM_BACKEND, MODEL, api_key=GEMINI_API_KEY)
+
+model_client = ModelClient(make_backend, LLM_MAX_CONCURRENCY, LLM_TIMEOUT, LLM_MAX_RETRIES,
+                           LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_QUEUE_TIMEOUT)
+# Responses are cached per backend and model so mock output never leaks into real sessions
+CACHE_MODEL_ID = f"{LLM_BACKEND}:{MODEL}"
+
+session_store = create_session_store(SESSION_BACKEND, SESSION_DB, SESSION_IDLE_TTL, SESSION_MAX)
+SESSION_COOKIE = "plc_session"
+
+REPORT_RENDER_OPTIONS = {
+    "spool_max_bytes": REPORT_SPOOL_MAX_BYTES,
+    "max_message_chars": REPORT_MAX_MESSAGE_CHARS,
+    "table_chunk_rows": REPORT_TABLE_CHUNK_ROWS,
+    "message_appendix": REPORT_MESSAGE_APPENDIX
+}
+report_jobs = ReportJobQueue(REPORT_DIR, REPORT_WORKERS, REPORT_JOB_TTL, REPORT_RENDER_OPTIONS)
+
+metrics = MetricsRegistry()
+
+
+def response_cache_metrics():
+    stats = response_cache.stats()
+    return [
+        ("plc_response_cache_hits_total", "counter", "Model response cache hits", [({}, stats["hits"])]),
+        ("plc_response_cache_misses_total", "counter", "Model response cache misses", [({}, stats["misses"])]),
+        ("plc_response_cache_hit_ratio", "gauge", "Model response cache hit ratio", [({}, stats["hit_rate"])]),
+        ("plc_response_cache_entries", "gauge", "Model responses held in memory", [({}, stats["entries"])]),
+    ]
 
-def add_pdf_header_section(story, session_data, styles):
-    """Add PDF header with title and basic info"""
-    
-    # Main title
-    title = Paragraph('PLC Code Generation Session Report', styles['title'])
-    story.append(title)
-    
-    # Subtitle
-    subtitle = Paragraph('IEC 61131-3 Structured Text Code Generator', styles['normal'])
-    subtitle.alignment = TA_CENTER
-    story.append(subtitle)
-    
-    story.append(Spacer(1, 20))
 
-def add_pdf_session_overview(story, session_data, styles):
-    """Add session overview table"""
-    
-    story.append(Paragraph('Session Overview', styles['heading']))
-    
-    # Create overview data
-    overview_data = [
-        ['Parameter', 'Value'],
-        ['Operator Name', session_data.get('operator_name', 'Not specified')],
-        ['Session Start Time', format_datetime(session_data.get('session_start_time'))],
-        ['Session End Time', format_datetime(session_data.get('session_end_time'))],
-        ['Duration', calculate_duration(session_data.get('session_start_time'), 
-                                      session_data.get('session_end_time'))],
-        ['Generation Mode', session_data.get('mode', 'User-defined').title()],
-        ['Total Chat Messages', str(len(session_data.get('chat_history', [])))],
-        ['Variables Retrieved', str(len(session_data.get('retrieved_context', [])))]
+def st_checker_metrics():
+    stats = st_checker.stats()
+    return [
+        ("plc_st_check_cache_hits_total", "counter", "Static check results served from cache", [({}, stats["hits"])]),
+        ("plc_st_check_cache_misses_total", "counter", "Static checks run", [({}, stats["misses"])]),
     ]
-    
-    # Create table
-    table = Table(overview_data, colWidths=[2*inch, 4*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a5568')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-    ]))
-    
-    story.append(table)
-    story.append(Spacer(1, 20))
 
-def add_pdf_chat_history_section(story, session_data, styles):
-    """Add complete chat history"""
-    
-    story.append(Paragraph('Chat History', styles['heading']))
-    
-    chat_history = session_data.get('chat_history', [])
-    
-    if not chat_history:
-        story.append(Paragraph('No chat history available.', styles['normal']))
-        return
-    
-    # Add each message as a formatted paragraph
-    for i, message in enumerate(chat_history):
-        role = message.get('role', 'Unknown').capitalize()
-        content = message.get('content', '')
-        timestamp = message.get('timestamp', 'N/A')
-        
-        # Create header for each message
-        msg_header = f"<b>[{timestamp}] {role}:</b>"
-        story.append(Paragraph(msg_header, styles['normal']))
-        
-        # Choose style based on role
-        msg_style = styles['chat_user'] if role.lower() == 'user' else styles['chat_bot']
-        
-        # Wrap long content
-        wrapped_content = wrap_text(content, 80)
-        story.append(Paragraph(wrapped_content, msg_style))
-        story.append(Spacer(1, 8))
-    
-    story.append(Spacer(1, 15))
-
-def add_pdf_generated_code_section(story, session_data, styles):
-    """Add the generated code section with proper formatting"""
-    
-    story.append(Paragraph('Generated Code', styles['heading']))
-    
-    generated_code = session_data.get('generated_code', {})
-    
-    # Variable Declarations
-    story.append(Paragraph('Variable Declarations', styles['subheading']))
-    
-    vars_code = generated_code.get('vars', 'No variable declarations generated.')
-    if vars_code.strip():
-        # Use Preformatted class for code blocks
-        from reportlab.platypus import Preformatted
-        
-        code_style = ParagraphStyle(
-            'PreformattedCode',
-            parent=styles['code'],
-            fontName='Courier',
-            fontSize=8,
-            leading=10,
-            leftIndent=10,
-            rightIndent=10,
-            spaceBefore=6,
-            spaceAfter=6
-        )
-        
-        story.append(Preformatted(vars_code, code_style))
-    else:
-        story.append(Paragraph('No variable declarations generated.', styles['normal']))
-    
-    story.append(Spacer(1, 15))
-    
-    # Logic Code
-    story.append(Paragraph('Logic Code', styles['subheading']))
-    
-    logic_code = generated_code.get('logic', 'No logic code generated.')
-    if logic_code.strip():
-        story.append(Preformatted(logic_code, code_style))
-    else:
-        story.append(Paragraph('No logic code generated.', styles['normal']))
-    
-    story.append(Spacer(1, 20))
 
+metrics.add_collector(response_cache_metrics)
+metrics.add_collector(st_checker_metrics)
 
-def add_pdf_retrieved_context_section(story, session_data, styles):
-    """Add retrieved context variables table"""
-    
-    story.append(Paragraph('Retrieved Context Variables', styles['heading']))
-    
-    context = session_data.get('retrieved_context', [])
-    
-    if not context:
-        story.append(Paragraph('No context variables retrieved.', styles['normal']))
-        return
-    
-    # Prepare table data
-    table_data = [['Tank', 'IO Type', 'Tag Name', 'Description', 'Data Type']]
-    
-    for var in context:
-        row = [
-            var.get('tank', ''),
-            var.get('io_type', ''),
-            var.get('tag', ''),
-            wrap_text(var.get('description', ''), 30),
-            var.get('type', '')
-        ]
-        table_data.append(row)
-    
-    # Create table
-    table = Table(table_data, colWidths=[0.8*inch, 1*inch, 1.2*inch, 2.2*inch, 0.8*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a5568')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-        ('TOPPADDING', (0, 1), (-1, -1), 4),
-        ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP')
-    ]))
-    
-    story.append(table)
-    story.append(Spacer(1, 20))
+def generate_text(prompt, deadline=None):
+    """Run the prompt through the model, serving repeats from the response cache"""
+    key = make_cache_key(prompt, CACHE_MODEL_ID)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
 
-def add_pdf_clarification_section(story, session_data, styles):
-    """Add clarification summary"""
-    
-    story.append(Paragraph('Clarification Summary', styles['heading']))
-    
-    clarification = session_data.get('clarification_summary', 
-                                   'No specific clarifications were recorded for this session.')
-    
-    # Split into paragraphs and add each
-    paragraphs = clarification.split('\n\n')
-    for para in paragraphs:
-        if para.strip():
-            wrapped_para = wrap_text(para.strip(), 100)
-            story.append(Paragraph(wrapped_para, styles['normal']))
-            story.append(Spacer(1, 8))
-
-def add_pdf_footer_section(story, styles):
-    """Add footer with generation timestamp"""
-    
-    story.append(Spacer(1, 30))
-    
-    # Horizontal line
-    line_data = [['_' * 80]]
-    line_table = Table(line_data)
-    line_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8)
-    ]))
-    story.append(line_table)
-    
-    story.append(Spacer(1, 10))
-    
-    # Footer text
-    footer_text = f"Report generated on {datetime.now().strftime('%Y-%m-%d at %H:%M:%S')}"
-    footer_para = Paragraph(footer_text, styles['normal'])
-    footer_para.alignment = TA_CENTER
-    story.append(footer_para)
-
-# Utility functions
-def format_datetime(dt):
-    """Format datetime object to string"""
-    if dt is None:
-        return 'Not recorded'
-    if isinstance(dt, str):
-        return dt
-    return dt.strftime('%Y-%m-%d %H:%M:%S')
-
-def calculate_duration(start_time, end_time):
-    """Calculate session duration"""
-    if start_time is None or end_time is None:
-        return 'Not calculated'
-    
-    try:
-        if isinstance(start_time, str):
-            start_time = datetime.fromisoformat(start_time)
-        if isinstance(end_time, str):
-            end_time = datetime.fromisoformat(end_time)
-        
-        duration = end_time - start_time
-        total_seconds = int(duration.total_seconds())
-        hours, remainder = divmod(total_seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        
-        if hours > 0:
-            return f"{hours}h {minutes}m {seconds}s"
-        elif minutes > 0:
-            return f"{minutes}m {seconds}s"
-        else:
-            return f"{seconds}s"
-            
-    except Exception:
-        return 'Not calculated'
+    text = model_client.generate(prompt, deadline)
+    response_cache.put(key, text)
+    return text
 
-def wrap_text(text, width):
-    """Wrap text to specified width"""
-    if not text:
-        return ""
-    return "<br/>".join(textwrap.wrap(str(text), width))
+def stream_text(prompt):
+    """Yield model output chunks as they arrive; cached responses come back as one chunk"""
+    key = make_cache_key(prompt, CACHE_MODEL_ID)
+    cached = response_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
 
-def escape_html(text):
-    """Escape HTML characters in text"""
-    if not text:
-        return ""
-    text = str(text)
-    text = text.replace('&', '&amp;')
-    text = text.replace('<', '&lt;')
-    text = text.replace('>', '&gt;')
-    text = text.replace('"', '&quot;')
-    text = text.replace("'", '&#x27;')
-    return text
+    chunks = []
+    for text in model_client.stream(prompt):
+        chunks.append(text)
+        yield text
+    response_cache.put(key, "".join(chunks))
+
+# ---------- Session state ----------
+def current_session():
+    """State for the caller's session (cookie or X-Session-Id header), created on first use"""
+    if "session_state" not in g:
+        session_id = request.cookies.get(SESSION_COOKIE) or request.headers.get("X-Session-Id")
+        if not valid_session_id(session_id):
+            session_id = new_session_id()
+            g.new_session_id = session_id
+        g.session_state = session_store.load(session_id)
+    return g.session_state
+
+
+@app.after_request
+def set_session_cookie(response):
+    session_id = g.get("new_session_id")
+    if session_id:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return response
+
+# ---------- Request metrics ----------
+def request_trace():
+    """Stage trace for the current request, labelled with its endpoint"""
+    if "trace" not in g:
+        g.trace = Trace(metrics, request.endpoint or "unknown")
+    return g.trace
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record latency and status; streamed bodies are timed up to the first byte"""
+    endpoint = request.endpoint or "unknown"
+    elapsed = time.perf_counter() - g.get("request_start", time.perf_counter())
+    metrics.observe("plc_request_duration_seconds", elapsed, {"endpoint": endpoint})
+    metrics.inc("plc_requests_total", {"endpoint": endpoint, "status": str(response.status_code)})
+
+    trace = g.get("trace")
+    if METRICS_SERVER_TIMING and trace is not None and trace.timings:
+        header = format_server_timing(trace.timings)
+        existing = response.headers.get("Server-Timing")
+        response.headers["Server-Timing"] = f"{existing}, {header}" if existing else header
+    return response
 
 # ------------------ ROUTES ------------------ #
 
@@ -443,16 +186,127 @@ def index():
 
 
 # ---------- Upload Excel ----------
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload exceeds {UPLOAD_MAX_BYTES} bytes"}), 413
+
+
+def parse_tag_file(path):
+    """Parse an uploaded tag list (loads pandas only when the cache misses)"""
+    return lazy.load("tag_parsing").parse_tag_file(path)
+
+
 @app.route("/api/upload_excel", methods=["POST"])
 def upload_excel():
-    global uploaded_variables
-    if "file" not in request.files:
+    """Upload a tag list as multipart `file`, or as the raw request body (?filename=)"""
+    state = current_session()
+    if request.mimetype == "multipart/form-data":
+        if "file" not in request.files:
+            return jsonify({"error": "No file uploaded"}), 400
+        f = request.files["file"]
+        stream, filename = f.stream, f.filename
+    else:
+        stream, filename = request.stream, request.args.get("filename", "")
+    try:
+        path, digest, size, duplicate = upload_store.save_stream(stream, filename)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    if not size:
         return jsonify({"error": "No file uploaded"}), 400
-    f = request.files["file"]
-    path = os.path.join(app.config["UPLOAD_FOLDER"], f.filename)
-    f.save(path)
-    uploaded_variables = parse_excel(path)
-    return jsonify({"message": "Excel uploaded and parsed", "count": len(uploaded_variables)})
+
+    try:
+        with request_trace().stage("parse_tags"):
+            variables, digest, cached = tag_cache.get_or_parse(path, parse_tag_file, digest)
+        metrics.inc("plc_tag_cache_requests_total", {"result": "hit" if cached else "miss"})
+    except Exception as e:
+        # Corrupt or mislabelled files fail inside pandas/openpyxl with all kinds of errors
+        if not duplicate:
+            upload_store.discard(path)
+        return jsonify({"error": f"Could not read tag list: {str(e)}"}), 400
+
+    # mode=merge upserts the file's tags into the current list instead of replacing it
+    if request.values.get("mode") == "merge":
+        state.uploaded_variables, diff = lazy.load("tag_delta").apply_tag_delta(
+            state.uploaded_variables, state.uploaded_index, upserts=variables)
+        state.uploaded_digest = ""
+        session_store.save(state)
+        return jsonify({
+            "message": "Excel merged into tag list",
+            "count": len(state.uploaded_variables),
+            "hash": digest,
+            "cached": cached,
+            "duplicate": duplicate,
+            "diff": diff
+        })
+
+    if not variables:
+        if not duplicate:
+            upload_store.discard(path)
+        return jsonify({"error": "No tags found in the uploaded file"}), 400
+
+    # Re-uploading the file the session already holds keeps the index built for it
+    if digest != state.uploaded_digest:
+        with request_trace().stage("index_tags"):
+            state.uploaded_variables = variables
+            state.uploaded_index = PartitionedTagIndex(state.uploaded_variables)
+        state.uploaded_digest = digest
+        session_store.save(state)
+    return jsonify({
+        "message": "Excel uploaded and parsed",
+        "count": len(state.uploaded_variables),
+        "hash": digest,
+        "cached": cached,
+        "duplicate": duplicate
+    })
+
+
+# ---------- Export parsed tag list ----------
+@app.route("/api/export_tags")
+def export_tags():
+    """Download the uploaded tag list as parquet, feather or csv (?format=)"""
+    state = current_session()
+    fmt = request.args.get("format") or default_export_format()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown export format: {fmt}"}), 400
+    buffer = io.BytesIO()
+    try:
+        lazy.load("tag_parsing").export_tag_file(state.uploaded_variables, buffer, fmt)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    buffer.seek(0)
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return send_file(buffer, mimetype=mimetype, as_attachment=True,
+                     download_name=f"tag_list{extension}")
+
+
+# ---------- Tag list delta ----------
+@app.route("/api/tag_delta", methods=["POST"])
+def tag_delta():
+    """Apply adds, updates and deletes (keyed by Tag) to the uploaded tag list
+
+    Accepts JSON {"upsert": [...], "delete": [...]} or a CSV/Excel file whose
+    optional `Action` column marks rows to delete.
+    """
+    state = current_session()
+    tag_delta = lazy.load("tag_delta")
+    try:
+        if "file" in request.files:
+            f = request.files["file"]
+            upserts, deletes = tag_delta.delta_from_file(f, f.filename)
+        else:
+            upserts, deletes = tag_delta.delta_from_json(request.get_json() or {})
+    except Exception as e:
+        return jsonify({"error": f"Could not read delta: {str(e)}"}), 400
+
+    state.uploaded_variables, diff = tag_delta.apply_tag_delta(
+        state.uploaded_variables, state.uploaded_index, upserts, deletes)
+    state.uploaded_digest = ""
+    session_store.save(state)
+    return jsonify({
+        "message": "Tag list updated",
+        "count": len(state.uploaded_variables),
+        "diff": diff
+    })
 
 
 # ---------- Add user variable ----------
@@ -474,13 +328,19 @@ def add_variable():
         "tank": tank,
         "io_type": io_type
     }
-    user_variables.append(new_var)
+    state = current_session()
+    state.user_variables.append(new_var)
+    state.user_index.add(new_var)
+    session_store.save(state)
     return jsonify({"message": "Variable added", "variable": new_var})
 
 
 @app.route("/api/clear_variables", methods=["POST"])
 def clear_variables():
-    user_variables.clear()
+    state = current_session()
+    state.user_variables.clear()
+    state.user_index.clear()
+    session_store.save(state)
     return jsonify({"message": "All user variables cleared."})
 
 
@@ -488,17 +348,22 @@ def clear_variables():
 def delete_variable():
     data = request.get_json()
     tag = (data.get("tag") or "").strip()
-    global user_variables
-    before = len(user_variables)
-    user_variables = [v for v in user_variables if v["name"] != tag]
-    return jsonify({"message": f"Deleted {before - len(user_variables)} variable(s)."})
+    state = current_session()
+    removed = state.user_index.remove_name(tag)
+    if removed:
+        state.user_variables = [v for v in state.user_variables if v["name"] != tag]
+        session_store.save(state)
+    return jsonify({"message": f"Deleted {removed} variable(s)."})
 
 
 # ---------- New route for deleting excel data ----------
 @app.route("/api/delete_excel", methods=["POST"])
 def delete_excel():
-    global uploaded_variables
-    uploaded_variables = []
+    state = current_session()
+    state.uploaded_variables = []
+    state.uploaded_index.clear()
+    state.uploaded_digest = ""
+    session_store.save(state)
     return jsonify({"message": "Excel data cleared."})
 
 
@@ -545,12 +410,12 @@ RULES:
 
 Ask what you need to know to understand the control logic.
 """
-    history = [{"role": "user", "parts": [{"text": clarification_prompt}]}]  # Assuming genai format
-
+    trace = request_trace()
+    trace.size("prompt", len(clarification_prompt))
     try:
-        model = genai.GenerativeModel(MODEL)
-        response = model.generate_content(history)
-        raw_reply = response.text.strip()
+        with trace.stage("model_call"):
+            raw_reply = generate_text(clarification_prompt).strip()
+        trace.size("response", len(raw_reply))
         
         # Check if model thinks it's ready
         if "READY:" in raw_reply.upper():
@@ -562,7 +427,8 @@ Ask what you need to know to understand the control logic.
             })
         
         # Filter and format response
-        bot_reply = filter_and_format_questions(raw_reply, conversation)
+        with trace.stage("postprocess"):
+            bot_reply = filter_and_format_questions(raw_reply, conversation)
         
         return jsonify({"reply": bot_reply, "ready": False})
         
@@ -628,39 +494,35 @@ def similarity_check(text1, text2):
 
 
 # ---------- Enhanced Variable Matching and Creation ----------
-def find_matching_variables(user_request, available_variables):
-    """Find variables that match the user's request based on keywords and context"""
-    matches = []
+# Keywords for different equipment types
+EQUIPMENT_KEYWORDS = {
+    'pump': ['pump', 'pumping'],
+    'valve': ['valve', 'valves'],
+    'motor': ['motor', 'motors', 'drive'],
+    'sensor': ['sensor', 'sensors'],
+    'level': ['level', 'levels', 'tank level'],
+    'pressure': ['pressure', 'press'],
+    'temperature': ['temperature', 'temp'],
+    'flow': ['flow', 'flowrate'],
+    'tank': ['tank', 'vessel', 'container']
+}
+
+def find_matching_variables(user_request, index):
+    """Find variables that match the user's request based on keywords and context
+
+    Looks up the equipment keywords mentioned in the request in the tag index;
+    each variable is returned at most once.
+    """
     request_lower = user_request.lower()
-    
-    # Keywords for different equipment types
-    equipment_keywords = {
-        'pump': ['pump', 'pumping'],
-        'valve': ['valve', 'valves'],
-        'motor': ['motor', 'motors', 'drive'],
-        'sensor': ['sensor', 'sensors'],
-        'level': ['level', 'levels', 'tank level'],
-        'pressure': ['pressure', 'press'],
-        'temperature': ['temperature', 'temp'],
-        'flow': ['flow', 'flowrate'],
-        'tank': ['tank', 'vessel', 'container']
-    }
-    
-    for var in available_variables:
-        var_name = var.get("name", "").lower()
-        var_comment = var.get("comment", "").lower()
-        var_io = var.get("io_type", "").lower()
-        
-        # Check if variable name or comment contains relevant keywords
-        for equipment, keywords in equipment_keywords.items():
-            if equipment in request_lower:
-                for keyword in keywords:
-                    if (keyword in var_name or keyword in var_comment or 
-                        any(k in var_name for k in keywords)):
-                        matches.append(var)
-                        break
-    
-    return matches
+
+    keywords = []
+    for equipment, equipment_words in EQUIPMENT_KEYWORDS.items():
+        if equipment in request_lower:
+            keywords.extend(equipment_words)
+
+    if not keywords:
+        return []
+    return index.match_keywords(keywords)
 
 def create_new_variable(var_name, user_request, existing_vars):
     """Create a new variable with appropriate IO type and description"""
@@ -739,7 +601,7 @@ def create_new_variable(var_name, user_request, existing_vars):
     
     return new_var
 
-def generate_unique_tag(base_name, existing_vars):
+def generate_unique_tag(base_name, allocator):
     """Generate a unique tag name to avoid conflicts"""
     # Clean base name
     base_name = re.sub(r'[^a-zA-Z0-9_]', '_', base_name)
@@ -748,50 +610,53 @@ def generate_unique_tag(base_name, existing_vars):
     if not base_name or base_name[0].isdigit():
         base_name = "VAR_" + base_name
     
-    # Check if base name is unique
-    existing_names = [var.get("name", "").lower() for var in existing_vars]
-    
-    if base_name.lower() not in existing_names:
-        return base_name
-    
-    # Add number suffix to make it unique
-    counter = 1
-    while f"{base_name}_{counter}".lower() in existing_names:
-        counter += 1
-    
-    return f"{base_name}_{counter}"
+    # Add a number suffix if the name is already taken
+    return allocator.allocate(base_name)
 
 
 # ---------- Enhanced Generate Function ----------
-@app.route("/api/generate", methods=["POST"])
-def generate():
-    data = request.json
+def prepare_generation(data, state, trace):
+    """Collect variables and build the generation prompt for a request payload
+
+    Returns a job dict, or None when the conversation has no user request.
+    """
     conversation = data.get("conversation", [])
-    gen_type = data.get("genType", "ST")
     source = data.get("source", "user")
 
     # Collect available variables based on mode
     if source == "excel":
-        available_vars = uploaded_variables.copy()
+        available_vars = state.uploaded_variables.copy()
+        index = state.uploaded_index
     else:
-        available_vars = user_variables.copy()
+        available_vars = state.user_variables.copy()
+        index = state.user_index
 
     # Extract user requirements from conversation
     user_messages = [m["content"] for m in conversation if m["role"] == "user"]
     if not user_messages:
-        return jsonify({"error": "No user request provided"}), 400
-    
+        return None
+
     user_request = "\n".join(user_messages)
 
+    # Restrict matching to the tanks named in the request (or given explicitly)
+    tanks = data.get("tanks") or index.detect_tanks(user_request)
+    io_types = data.get("io_types")
+    scope = index.scoped(tanks, io_types)
+
     # Find matching existing variables
-    matching_vars = find_matching_variables(user_request, available_vars)
+    matching_vars = find_matching_variables(user_request, scope)
+
+    # Only the most relevant tags go into the prompt
+    prompt_vars = select_prompt_variables(user_request, scope, matching_vars,
+                                          RETRIEVAL_TOP_K, RETRIEVAL_TOKEN_BUDGET,
+                                          format_variable_line)
 
     # Build enhanced prompt for code generation
     prompt = f"""
 You are an expert PLC programmer. Generate efficient Structured Text code that uses existing variables when possible.
 
 EXISTING VARIABLES:
-{format_available_variables(available_vars)}
+{format_available_variables(prompt_vars)}
 
 USER REQUEST:
 {user_request}
@@ -814,208 +679,603 @@ END_VAR
 Generate the code now:
 """
 
-    try:
-        model = genai.GenerativeModel(MODEL)
-        response = model.generate_content(prompt)
-        st_code = response.text.strip()
+    trace.size("prompt", len(prompt))
+    return {
+        "state": state,
+        "trace": trace,
+        "index": index,
+        "prompt": prompt,
+        "source": source,
+        "user_request": user_request,
+        "available_vars": available_vars,
+        "prompt_vars": prompt_vars,
+        "scope": {"tanks": [t for t in tanks if t in index.tank_names()],
+                  "io_types": io_types or [], "tags": len(scope)}
+    }
+
+
+def reconcile_variables(declared_vars, job):
+    """Map declared variables onto known tags, classifying and renaming new ones"""
+    available_vars = job["available_vars"]
+    user_request = job["user_request"]
+
+    # Enhance variables with proper IO types and descriptions
+    enhanced_vars = []
+    index = job["index"]
+    allocator = UniqueNameAllocator(index)  # For unique name checking
+
+    for var in declared_vars:
+        var_name = var.get("tag", "")
+
+        # Check if this variable exists in our available variables
+        existing_var = index.lookup_name(var_name)
+
+        if existing_var:
+            # Use existing variable info
+            enhanced_var = {
+                "tag": existing_var.get("name", ""),
+                "io_type": existing_var.get("io_type", "Internal"),
+                "description": existing_var.get("comment", ""),
+                "type": existing_var.get("type", "BOOL"),
+                "tank": existing_var.get("tank", ""),
+                "origin": "tag_list"
+            }
+        else:
+            # Create new variable with proper classification
+            unique_name = generate_unique_tag(var_name, allocator)
+            new_var = create_new_variable(unique_name, user_request, available_vars)
+
+            enhanced_var = {
+                "tag": new_var["name"],
+                "io_type": new_var["io_type"],
+                # The declared comment and type (e.g. REAL := 50.0) beat the name-based guesses
+                "description": var.get("description") or new_var["comment"],
+                "type": var.get("type") or new_var["type"],
+                "tank": new_var.get("tank", ""),
+                # io_type is only a guess from the name
+                "origin": "generated"
+            }
+
+        # Keep where and how the program declared it
+        enhanced_var["section"] = var.get("section") or "VAR"
+        enhanced_var["initial_value"] = var.get("initial_value", "")
+        enhanced_vars.append(enhanced_var)
+
+    return enhanced_vars
+
+
+def finish_generation(job, st_code, save_context=True, program=None):
+    """Parse the model output and reconcile its variables with the known tags
+
+    `program` is the already-parsed st_code when it was parsed while streaming.
+    Diagnostic lines count from the first line of the returned "logic"; see
+    logic_diagnostics.
+    """
+    trace = job["trace"]
+    trace.size("response", len(st_code))
+
+    with trace.stage("parse"):
+        # Parse the generated code once; declarations and logic both come from the AST
+        if program is None:
+            program = parse_st(st_code)
+        var_declarations, logic, logic_line = split_generated_code(st_code, program)
 
-        # Parse the generated code
-        var_declarations, logic = parse_generated_code(st_code)
-        
         # Extract variables used in the code
-        declared_vars = parse_st_vars(var_declarations)
-        
-        # Enhance variables with proper IO types and descriptions
-        enhanced_vars = []
-        all_existing_vars = available_vars + enhanced_vars  # For unique name checking
-        
-        for var in declared_vars:
-            var_name = var.get("tag", "")
-            
-            # Check if this variable exists in our available variables
-            existing_var = None
-            for av in available_vars:
-                if av.get("name", "").lower() == var_name.lower():
-                    existing_var = av
-                    break
-            
-            if existing_var:
-                # Use existing variable info
-                enhanced_var = {
-                    "tag": existing_var.get("name", ""),
-                    "io_type": existing_var.get("io_type", "Internal"),
-                    "description": existing_var.get("comment", ""),
-                    "type": existing_var.get("type", "BOOL"),
-                    "tank": existing_var.get("tank", "")
-                }
-            else:
-                # Create new variable with proper classification
-                unique_name = generate_unique_tag(var_name, all_existing_vars)
-                new_var = create_new_variable(unique_name, user_request, all_existing_vars)
-                
-                enhanced_var = {
-                    "tag": new_var["name"],
-                    "io_type": new_var["io_type"], 
-                    "description": new_var["comment"],
-                    "type": new_var["type"],
-                    "tank": new_var.get("tank", "")
-                }
-                all_existing_vars.append(new_var)
-            
-            enhanced_vars.append(enhanced_var)
+        declared_vars = declared_variables(program)
+
+    with trace.stage("reconcile"):
+        enhanced_vars = reconcile_variables(declared_vars, job)
+
+    with trace.stage("check"):
+        # Undeclared/unused names, BOOL/REAL misuse and writes to inputs
+        diagnostics = logic_diagnostics(st_checker.check(st_code, enhanced_vars, program), logic_line)
+
+    # Update session context with enhanced variables
+    if save_context:
+        state = job["state"]
+        state.last_context = enhanced_vars
+        session_store.save(state)
+
+    return {
+        "vars": format_var_block(enhanced_vars),
+        "logic": logic,
+        "context": enhanced_vars,
+        "diagnostics": diagnostics,
+        "repairs": job.get("repairs", []),
+        "mode": job["source"],
+        "tags_in_prompt": len(job["prompt_vars"]),
+        "tags_available": len(job["available_vars"]),
+        "scope": job["scope"]
+    }
+
+
+def format_var_block(variables):
+    """Rebuild declarations with enhanced info, one block per declared section"""
+    sections = {}
+    for var in variables:
+        sections.setdefault(var.get("section") or "VAR", []).append(var)
+    if not sections:
+        return "VAR\nEND_VAR"
+
+    blocks = []
+    for section, section_vars in sections.items():
+        lines = [section]
+        for var in section_vars:
+            init = f" := {var['initial_value']}" if var.get("initial_value") else ""
+            lines.append(f"{var['tag']} : {var['type']}{init}; (* {var['description']} *)")
+        lines.append("END_VAR")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def repair_generation(job, st_code, program):
+    """Patch malformed model output; returns (st_code, program)
+
+    A missing VAR block and undeclared names that are known tags are fixed
+    locally, again whenever a model repair uncovers more of them (names in
+    statements that failed to parse only show up once they parse). Syntax
+    errors and unknown names get a compact repair prompt (the request, the
+    numbered output and the problems - not the tag list) asking for changes
+    only. Model repairs stop after REPAIR_MAX_ATTEMPTS calls or
+    REPAIR_DEADLINE seconds; what was done is kept in job["repairs"].
+    """
+    trace = job["trace"]
+    repairs = job["repairs"] = []
+
+    # Validate only the code: prose around it is dropped, and a reply with
+    # no code at all is returned as it is rather than "repaired"
+    code = extract_code(st_code)
+    if code is None:
+        return st_code, program
+    if code != st_code:
+        st_code = code
+        program = parse_st(st_code)
+
+    deadline = time.monotonic() + REPAIR_DEADLINE
+    model_calls = 0
+    declared_locally = set()
+    var_block_added = False
+
+    while True:
+        issues = find_repair_issues(program)
+        if issues is None:
+            break
 
-        # Update global context with enhanced variables
-        global last_context
-        last_context = enhanced_vars
+        known = [job["index"].lookup_name(name) for name in issues["undeclared"]
+                 if name.upper() not in declared_locally]
+        known = [var for var in known if var]
+        if known or (issues["missing_var"] and not var_block_added):
+            var_block_added = var_block_added or issues["missing_var"]
+            declared_locally.update(var["name"].upper() for var in known)
+            with trace.stage("repair"):
+                st_code = add_declarations(st_code, program, [declaration_line(var) for var in known])
+                program = parse_st(st_code)
+            repairs.append({"kind": "local", "declared": [var["name"] for var in known]})
+            continue
 
-        # Rebuild variable declarations with enhanced info
-        enhanced_var_block = "VAR\n"
-        for var in enhanced_vars:
-            enhanced_var_block += f"{var['tag']} : {var['type']}; (* {var['description']} *)\n"
-        enhanced_var_block += "END_VAR"
+        if model_calls >= REPAIR_MAX_ATTEMPTS or time.monotonic() >= deadline:
+            break
+        model_calls += 1
+        prompt = build_repair_prompt(job["user_request"], st_code, issues)
+        start = time.perf_counter()
+        repair = {"kind": "model", "issues": len(issues["syntax"]) + len(issues["undeclared"]),
+                  "prompt_chars": len(prompt)}
+        repairs.append(repair)
+        try:
+            with trace.stage("repair"):
+                reply = generate_text(prompt, deadline=deadline)
+                repaired = apply_repair(st_code, program, reply)
+        except Exception as e:
+            # A failed repair (deadline, busy model, upstream error) keeps the output as it is
+            repair["error"] = str(e)
+            break
+        finally:
+            repair["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if repaired == st_code:
+            break
+        st_code = repaired
+        program = parse_st(st_code)
+
+    return st_code, program
+
+
+def declaration_line(var):
+    """`name : TYPE; (* comment *)` for a tag-list variable"""
+    line = f"{var['name']} : {var.get('type') or 'BOOL'};"
+    comment = (var.get("comment") or "").replace("*)", "* )")
+    return f"{line} (* {comment} *)" if comment else line
+
+
+@app.route("/api/generate", methods=["POST"])
+def generate():
+    trace = request_trace()
+    with trace.stage("prompt_build"):
+        job = prepare_generation(request.json, current_session(), trace)
+    if job is None:
+        return jsonify({"error": "No user request provided"}), 400
+
+    try:
+        with trace.stage("model_call"):
+            st_code = generate_text(job["prompt"]).strip()
+        st_code, program = repair_generation(job, st_code, parse_st(st_code))
+        return jsonify(finish_generation(job, st_code, program=program))
 
-        return jsonify({
-            "vars": enhanced_var_block,
-            "logic": logic,
-            "context": enhanced_vars,
-            "mode": source
-        })
-        
     except Exception as e:
         return jsonify({"error": f"Generation failed: {str(e)}"}), 500
 
 
+def sse_event(event, payload):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.route("/api/generate_stream", methods=["POST"])
+def generate_stream():
+    """Streaming variant of /api/generate
+
+    Emits `token` events with model text as it arrives, then a single
+    `result` event carrying the same payload /api/generate returns.
+    """
+    trace = request_trace()
+    with trace.stage("prompt_build"):
+        job = prepare_generation(request.json, current_session(), trace)
+    if job is None:
+        return jsonify({"error": "No user request provided"}), 400
+
+    def events():
+        chunks = []
+        # Parse while tokens arrive so the result is ready as soon as the stream ends
+        parser = STParser()
+        try:
+            with trace.stage("model_call"):
+                for text in stream_text(job["prompt"]):
+                    chunks.append(text)
+                    parser.feed(text)
+                    yield sse_event("token", {"text": text})
+            # Unstripped, so the AST's offsets line up with the text
+            st_code, program = repair_generation(job, "".join(chunks), parser.close())
+            yield sse_event("result", finish_generation(job, st_code, program=program))
+        except Exception as e:
+            yield sse_event("error", {"error": f"Generation failed: {str(e)}"})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ---------- Batch generation ----------
+def expand_batch_items(data, state):
+    """Normalize a batch payload into [{"id", "conversation"}, ...]
+
+    Items may carry a full `conversation` or a single `request` string.
+    Alternatively `template` plus `tanks` (a list, or "all" for every tank in
+    the uploaded tag list) produces one item per tank with {tank} filled in,
+    scoped to that tank's tags. Raises ValueError for a malformed payload.
+    """
+    items = []
+    template = data.get("template")
+    if template:
+        if not isinstance(template, str):
+            raise ValueError("template must be a string")
+        tanks = data.get("tanks", "all")
+        if tanks == "all":
+            tanks = sorted(state.uploaded_index.tank_names())
+        elif not isinstance(tanks, list) or not all(isinstance(t, str) for t in tanks):
+            raise ValueError('tanks must be a list of tank names or "all"')
+        for tank in tanks:
+            items.append({"id": tank, "request": template.replace("{tank}", tank), "tanks": [tank]})
+    extra = data.get("items", [])
+    if not isinstance(extra, list):
+        raise ValueError("items must be a list")
+    items.extend(extra)
+
+    normalized = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"Batch item {i} must be an object")
+        conversation = item.get("conversation")
+        if conversation is None:
+            conversation = [{"role": "user", "content": item.get("request", "")}]
+        normalized.append({"id": item.get("id", i), "conversation": conversation,
+                           "tanks": item.get("tanks"), "io_types": item.get("io_types")})
+    return normalized
+
+
+def run_batch_item(job):
+    """Generate one batch item; errors are reported per item"""
+    start = time.perf_counter()
+    try:
+        with job["trace"].stage("model_call"):
+            st_code = generate_text(job["prompt"]).strip()
+        st_code, program = repair_generation(job, st_code, parse_st(st_code))
+        result = finish_generation(job, st_code, save_context=False, program=program)
+        status = "ok"
+    except Exception as e:
+        result = {"error": f"Generation failed: {str(e)}"}
+        status = "error"
+    result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    result["status"] = status
+    return result
+
+
+@app.route("/api/generate_batch", methods=["POST"])
+def generate_batch():
+    """Generate ST for many requests at once
+
+    All items share the session's tag list and index; model calls fan out on
+    up to BATCH_MAX_CONCURRENCY threads (and stay within the model client's
+    own concurrency limit).
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Batch payload must be a JSON object"}), 400
+    state = current_session()
+    source = data.get("source", "excel")
+    try:
+        items = expand_batch_items(data, state)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not items:
+        return jsonify({"error": "No batch items provided"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} items per batch"}), 400
+
+    start = time.perf_counter()
+    results = [None] * len(items)
+    jobs = {}
+    for pos, item in enumerate(items):
+        trace = Trace(metrics, "generate_batch_item")
+        with trace.stage("prompt_build"):
+            job = prepare_generation({"conversation": item["conversation"], "source": source,
+                                      "tanks": item["tanks"], "io_types": item["io_types"]},
+                                     state, trace)
+        if job is None:
+            results[pos] = {"id": item["id"], "status": "error", "error": "No user request provided"}
+        else:
+            jobs[pos] = job
+
+    workers = max(1, min(BATCH_MAX_CONCURRENCY, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for pos, result in zip(jobs, pool.map(run_batch_item, jobs.values())):
+            result["id"] = items[pos]["id"]
+            results[pos] = result
+
+    elapsed = [r["elapsed_ms"] for r in results if "elapsed_ms" in r]
+    return jsonify({
+        "results": results,
+        "summary": {
+            "items": len(results),
+            "succeeded": sum(1 for r in results if r["status"] == "ok"),
+            "failed": sum(1 for r in results if r["status"] != "ok"),
+            "concurrency": workers,
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+            "max_item_ms": max(elapsed, default=0),
+            "mean_item_ms": round(sum(elapsed) / len(elapsed), 1) if elapsed else 0
+        }
+    })
+
+
 def format_available_variables(variables):
     """Format available variables for the AI prompt"""
     if not variables:
         return "No variables available - will create new ones as needed."
     
-    formatted = []
-    for var in variables:
-        name = var.get("name", "")
-        var_type = var.get("type", "")
-        comment = var.get("comment", "")
-        io_type = var.get("io_type", "")
-        tank = var.get("tank", "")
-        
-        formatted.append(f"- {name} ({var_type}): {comment} [{io_type}, Tank: {tank}]")
-    
-    return "\n".join(formatted)
+    return "\n".join(format_variable_line(var) for var in variables)
 
 
-def parse_generated_code(st_code):
-    """Parse generated code into variable declarations and logic sections"""
-    # Find VAR...END_VAR block
-    var_pattern = r'VAR\s*(.*?)\s*END_VAR'
-    var_match = re.search(var_pattern, st_code, re.DOTALL | re.IGNORECASE)
-    
-    if var_match:
-        var_content = var_match.group(1).strip()
-        var_declarations = f"VAR\n{var_content}\nEND_VAR"
-        
-        # Everything after END_VAR is logic
-        logic_start = var_match.end()
-        logic = st_code[logic_start:].strip()
-    else:
+def format_variable_line(var):
+    """Format a single variable as one prompt line"""
+    name = var.get("name", "")
+    var_type = var.get("type", "")
+    comment = var.get("comment", "")
+    io_type = var.get("io_type", "")
+    tank = var.get("tank", "")
+
+    return f"- {name} ({var_type}): {comment} [{io_type}, Tank: {tank}]"
+
+
+def parse_generated_code(st_code, program=None):
+    """Parse generated code into variable declarations and logic sections
+
+    Every VAR section (VAR_INPUT, VAR_OUTPUT, ...) goes into the declarations;
+    the logic is everything after the last section that precedes the first
+    statement. Pass `program` when st_code has already been parsed.
+    """
+    var_declarations, logic, _ = split_generated_code(st_code, program)
+    return var_declarations, logic
+
+
+def split_generated_code(st_code, program=None):
+    """parse_generated_code plus the st_code line the returned logic starts on"""
+    if program is None:
+        program = parse_st(st_code)
+    sections = [s for s in program.var_sections if s.closed]
+    if not sections:
         # No VAR block found - treat entire content as logic
+        logic_start = 0
         var_declarations = "VAR\nEND_VAR"
-        logic = st_code
-    
-    return var_declarations, logic
+        raw_logic = st_code
+    else:
+        var_declarations = "\n".join(st_code[s.start:s.end] for s in sections)
+        leading = [s.end for s in sections if program.logic_start is None or s.end <= program.logic_start]
+        logic_start = leading[-1] if leading else sections[-1].end
+        # Fence lines are blanked, not removed, so line numbers still line up
+        raw_logic = FENCE_RE.sub("", st_code[logic_start:])
+
+    logic = raw_logic.strip()
+    skipped = raw_logic[:len(raw_logic) - len(raw_logic.lstrip())].count("\n")
+    first_line = st_code.count("\n", 0, logic_start) + 1 + skipped
+    return var_declarations, logic, first_line
+
+
+FENCE_RE = re.compile(r"^[ \t]*```.*$", re.MULTILINE)
+
+
+def logic_diagnostics(diagnostics, first_line):
+    """Checker diagnostics renumbered against the returned logic
+
+    Problems inside the declarations get line None, since the VAR block is
+    rebuilt from the reconciled context; "section" says which block it is.
+    """
+    mapped = []
+    for d in diagnostics:
+        d = dict(d)
+        if d["line"] is not None and d["line"] >= first_line:
+            d["line"] = d["line"] - first_line + 1
+            d["section"] = "logic"
+        else:
+            d["line"] = None
+            d["section"] = "vars"
+        mapped.append(d)
+    return mapped
 
 
 def parse_st_vars(var_block):
-    """Extract variable information from VAR declarations"""
-    vars_list = []
+    """Extract variable information from VAR declarations (all sections)"""
     if not var_block:
-        return vars_list
-        
-    lines = var_block.split("\n")
-    in_var = False
-    
-    for line in lines:
-        line = line.strip()
-        if line.upper() == "VAR":
-            in_var = True
-            continue
-        if line.upper() == "END_VAR":
-            in_var = False
-            continue
-        if not in_var or not line or not ":" in line:
-            continue
+        return []
+    return declared_variables(parse_st(var_block))
+
+# ---------- Tanks ----------
+@app.route("/api/tanks")
+def list_tanks():
+    """Tanks in the session's tag list with tag counts per IO type"""
+    state = current_session()
+    source = request.args.get("source", "excel")
+    index = state.uploaded_index if source == "excel" else state.user_index
+    return jsonify({"tanks": index.tank_summary(), "total": len(index)})
+
+
+# ---------- Metrics ----------
+@app.route("/metrics")
+def prometheus_metrics():
+    """Request, stage, payload-size and cache metrics in Prometheus text format"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# ---------- Response cache stats ----------
+@app.route("/api/cache_stats")
+def cache_stats():
+    return jsonify(response_cache.stats())
 
-        # Parse: name : type; (* comment *)
-        match = re.match(r'(\w+)\s*:\s*(\w+)\s*;\s*(?:\(\*\s*(.*?)\s*\*\))?', line)
-        if match:
-            name = match.group(1)
-            var_type = match.group(2)
-            comment = match.group(3) if match.group(3) else ""
-
-            vars_list.append({
-                "tag": name,
-                "io_type": "Internal",  # Will be enhanced later
-                "description": comment,
-                "type": var_type,
-                "tank": ""
-            })
-    
-    return vars_list
 
 # ---------- Download Context ----------
 @app.route("/api/download_context")
 def download_context():
-    global last_context
+    last_context = current_session().last_context
     if not last_context:
         return jsonify({"error": "No context available"}), 400
 
-    df = pd.DataFrame(last_context)
-    out_path = os.path.join(app.config['UPLOAD_FOLDER'], "retrieved_context.xlsx")
-    df.to_excel(out_path, index=False)
-    return send_file(out_path, as_attachment=True, download_name="retrieved_context.xlsx")
+    # Built in memory so concurrent sessions never share an output file
+    df = lazy.load("dataframes").DataFrame(last_context)
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    buffer.seek(0)
+    return send_file(buffer, as_attachment=True, download_name="retrieved_context.xlsx")
+
+
+def build_report_session_data(data):
+    """Collect session data for the PDF report from a request payload"""
+    return {
+        'operator_name': data.get('operator_name', 'Anonymous'),
+        'session_start_time': data.get('session_start_time'),
+        'session_end_time': datetime.now(),
+        'chat_history': data.get('chat_history', []),
+        'generated_code': {
+            'vars': data.get('generated_vars', ''),
+            'logic': data.get('generated_logic', '')
+        },
+        'retrieved_context': data.get('retrieved_context', []),
+        'mode': data.get('mode', 'user'),
+        'clarification_summary': data.get('clarification_summary', 
+            'The user interacted with the system to generate PLC control logic. '
+            'Through iterative clarification, the system understood the requirements '
+            'and generated appropriate IEC 61131-3 Structured Text code.')
+    }
+
+
+def format_server_timing(timings, prefix=""):
+    """Render {name: ms} as a Server-Timing header value"""
+    return ", ".join(f"{prefix}{name.replace('_', '-')};dur={ms:.1f}" for name, ms in timings.items())
+
+
+def report_filename(session_data):
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    operator = session_data['operator_name'].replace(' ', '_')
+    return f"PLC_Session_Report_{operator}_{timestamp}.pdf"
 
 
-# ADD THIS NEW ROUTE HERE:
 @app.route("/api/generate_report", methods=["POST"])
 def generate_report():
     """Generate and download session report as PDF"""
     try:
-        data = request.get_json()
-        
-        # Collect session data
-        session_data = {
-            'operator_name': data.get('operator_name', 'Anonymous'),
-            'session_start_time': data.get('session_start_time'),
-            'session_end_time': datetime.now(),
-            'chat_history': data.get('chat_history', []),
-            'generated_code': {
-                'vars': data.get('generated_vars', ''),
-                'logic': data.get('generated_logic', '')
-            },
-            'retrieved_context': data.get('retrieved_context', []),
-            'mode': data.get('mode', 'user'),
-            'clarification_summary': data.get('clarification_summary', 
-                'The user interacted with the system to generate PLC control logic. '
-                'Through iterative clarification, the system understood the requirements '
-                'and generated appropriate IEC 61131-3 Structured Text code.')
-        }
+        session_data = build_report_session_data(request.get_json())
         
-        # Generate PDF report
-        report_file = generate_session_report_pdf(session_data)
+        # Generate PDF report; send_file closes the buffer once it has been streamed
+        timings = {}
+        report_file = lazy.load("reports").generate_session_report_pdf(
+            session_data, timings=timings, **REPORT_RENDER_OPTIONS)
+        filename = report_filename(session_data)
         
-        # Generate filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        operator = session_data['operator_name'].replace(' ', '_')
-        filename = f"PLC_Session_Report_{operator}_{timestamp}.pdf"
-        
-        return send_file(
+        response = send_file(
             report_file, 
             as_attachment=True, 
             download_name=filename,
             mimetype='application/pdf'
         )
+        response.headers["Server-Timing"] = format_server_timing(timings, "pdf-")
+        return response
         
     except Exception as e:
         return jsonify({"error": f"PDF report generation failed: {str(e)}"}), 500
 
+
+# ---------- Background report jobs ----------
+@app.route("/api/report_jobs", methods=["POST"])
+def submit_report_job():
+    """Queue a session report for rendering on the report process pool"""
+    session_data = build_report_session_data(request.get_json())
+    job_id = report_jobs.submit(session_data, report_filename(session_data))
+    return jsonify({
+        "job_id": job_id,
+        "status": "pending",
+        "status_url": f"/api/report_jobs/{job_id}",
+        "download_url": f"/api/report_jobs/{job_id}/download"
+    }), 202
+
+
+@app.route("/api/report_jobs/<job_id>")
+def report_job_status(job_id):
+    job = report_jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown report job"}), 404
+    return jsonify(job)
+
+
+@app.route("/api/report_jobs/<job_id>/download")
+def download_report_job(job_id):
+    job = report_jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown report job"}), 404
+    if job["status"] != "done":
+        return jsonify(job), 409
+    return send_file(report_jobs.result_path(job_id), as_attachment=True,
+                     download_name=job["filename"], mimetype='application/pdf')
+
+# ---------- Diagnostics ----------
+@app.route("/api/diagnostics/startup")
+def startup_diagnostics():
+    """Start-up time and per-subsystem import times (?load=1 imports everything first)"""
+    if request.args.get("load"):
+        for name in lazy.subsystems:
+            try:
+                lazy.load(name)
+            except ImportError:
+                pass
+    return jsonify(lazy.report())
+
+
+lazy.record_startup(STARTUP_START)
+lazy.preload(PRELOAD_SUBSYSTEMS)
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""Offline benchmarks for the tag-list, prompt, ST parsing and PDF report paths.
+
+    python -m benchmarks.run_benchmarks --sizes 1000,10000 --repeat 5
+    python -m benchmarks.run_benchmarks --json bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json --max-regression 0.25
+
+Each stage reports throughput (items/s), latency percentiles and the peak
+Python heap allocation of one run. With --baseline the run exits non-zero
+when any stage's p50 is slower than the baseline by more than
+--max-regression.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("LLM_BACKEND", "mock")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+from benchmarks import synthetic  # noqa: E402
+from utils.excel_parser import parse_excel, parse_tag_file  # noqa: E402
+from utils.pdf_report import generate_session_report_pdf  # noqa: E402
+from utils.retrieval import select_prompt_variables  # noqa: E402
+from utils.st_checker import check_program  # noqa: E402
+from utils.st_parser import parse_st, declared_variables  # noqa: E402
+from utils.tag_index import TagIndex  # noqa: E402
+from utils.tag_store import PartitionedTagIndex  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+QUERIES = [
+    "start the transfer pump when tank 3 level is low",
+    "open the inlet control valve on high pressure alarm",
+    "stop the heater when temperature exceeds the setpoint",
+    "trip the agitator motor if the flow drops",
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def measure(fn, repeat, items):
+    """Time fn() `repeat` times, then run it once more under tracemalloc for peak memory"""
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    p50 = percentile(samples, 50)
+    return {
+        "items": items,
+        "runs": repeat,
+        "p50_ms": p50 * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": statistics.mean(samples) * 1000,
+        "throughput_per_s": items / p50 if p50 else float("inf"),
+        "peak_mem_kb": peak / 1024,
+    }
+
+
+def stage_parse(size, workdir, repeat):
+    path = os.path.join(workdir, f"tags_{size}.xlsx")
+    if not os.path.exists(path):
+        synthetic.write_tag_file(path, size)
+    return measure(lambda: parse_excel(path), repeat, size)
+
+
+def stage_parse_csv(size, workdir, repeat):
+    path = os.path.join(workdir, f"tags_{size}.csv")
+    if not os.path.exists(path):
+        synthetic.write_tag_file(path, size)
+    return measure(lambda: parse_tag_file(path), repeat, size)
+
+
+def stage_index(size, workdir, repeat):
+    variables = synthetic.make_variables(size)
+    return measure(lambda: TagIndex(variables), repeat, size)
+
+
+def stage_match(size, workdir, repeat):
+    index = TagIndex(synthetic.make_variables(size))
+    return measure(lambda: [app.find_matching_variables(q, index) for q in QUERIES],
+                   repeat, len(QUERIES))
+
+
+def stage_scoped_match(size, workdir, repeat):
+    index = PartitionedTagIndex(synthetic.make_variables(size))
+
+    def match():
+        for query in QUERIES:
+            scope = index.scoped(index.detect_tanks(query))
+            app.find_matching_variables(query, scope)
+
+    return measure(match, repeat, len(QUERIES))
+
+
+def stage_prompt(size, workdir, repeat):
+    index = TagIndex(synthetic.make_variables(size))
+
+    def build():
+        for query in QUERIES:
+            matching = app.find_matching_variables(query, index)
+            selected = select_prompt_variables(query, index, matching, app.RETRIEVAL_TOP_K,
+                                               app.RETRIEVAL_TOKEN_BUDGET, app.format_variable_line)
+            app.format_available_variables(selected)
+
+    return measure(build, repeat, len(QUERIES))
+
+
+def stage_st_parse(size, workdir, repeat):
+    n_vars = min(max(size // 20, 20), 5000)
+    output = synthetic.make_llm_output(n_vars)
+
+    def parse():
+        var_block, _ = app.parse_generated_code(output)
+        app.parse_st_vars(var_block)
+
+    return measure(parse, repeat, n_vars)
+
+
+def stage_st_check(size, workdir, repeat):
+    n_vars = min(max(size // 20, 20), 5000)
+    program = parse_st(synthetic.make_llm_output(n_vars))
+    context = declared_variables(program)
+
+    def check():
+        check_program(program, context)
+
+    return measure(check, repeat, n_vars)
+
+
+def stage_pdf(size, workdir, repeat):
+    n_messages = max(20, size // 200)
+    context = synthetic.make_context(synthetic.make_variables(min(size, 2000)))
+    session_data = {
+        "operator_name": "Benchmark",
+        "session_start_time": "2025-01-01T10:00:00",
+        "session_end_time": "2025-01-01T11:00:00",
+        "chat_history": synthetic.make_chat_history(n_messages),
+        "generated_code": {"vars": "VAR\nEND_VAR", "logic": synthetic.make_llm_output(50)},
+        "retrieved_context": context,
+        "mode": "excel",
+        "clarification_summary": "Synthetic benchmark session.",
+    }
+
+    def render():
+        generate_session_report_pdf(session_data).close()
+
+    return measure(render, repeat, n_messages + len(context))
+
+
+STAGES = {
+    "parse": stage_parse,
+    "parse_csv": stage_parse_csv,
+    "index": stage_index,
+    "match": stage_match,
+    "scoped": stage_scoped_match,
+    "prompt": stage_prompt,
+    "st_parse": stage_st_parse,
+    "st_check": stage_st_check,
+    "pdf": stage_pdf,
+}
+
+
+def compare(results, baseline, max_regression):
+    """Return a list of (key, baseline p50, current p50) for regressed stages"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous and current["p50_ms"] > previous["p50_ms"] * (1 + max_regression):
+            regressions.append((key, previous["p50_ms"], current["p50_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated tag-list sizes")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated stage names")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workdir", help="where synthetic workbooks are cached")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    stages = [s for s in args.stages.split(",") if s]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="plc_bench_")
+    os.makedirs(workdir, exist_ok=True)
+
+    results = {}
+    header = f"{'stage':<10}{'size':>8}{'items':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'items/s':>12}{'peak KB':>11}"
+    print(header)
+    print("-" * len(header))
+    for size in sizes:
+        for name in stages:
+            r = STAGES[name](size, workdir, args.repeat)
+            results[f"{name}/{size}"] = r
+            print(f"{name:<10}{size:>8}{r['items']:>8}{r['p50_ms']:>11.2f}{r['p95_ms']:>11.2f}"
+                  f"{r['p99_ms']:>11.2f}{r['throughput_per_s']:>12.0f}{r['peak_mem_kb']:>11.0f}")
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, args.max_regression)
+        for key, before, after in regressions:
+            print(f"REGRESSION {key}: p50 {before:.2f} ms -> {after:.2f} ms")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Synthetic tag lists, model outputs and chat histories for benchmarks"""
+import random
+
+import pandas as pd
+
+IO_TYPES = ["Analog In", "Analog Out", "Digital In", "Digital Out"]
+PREFIX = {"Analog In": "ai", "Analog Out": "ao", "Digital In": "di", "Digital Out": "do"}
+EQUIPMENT = [
+    ("LT", "Water Level Transmitter"), ("LAH", "High Level Alarm"), ("LSL", "Low Level Switch"),
+    ("PT", "Pressure Transmitter"), ("TT", "Temperature Transmitter"), ("FT", "Flow Transmitter"),
+    ("PUMP", "Transfer Pump"), ("CV", "Inlet Control Valve"), ("OCV", "Outlet Valve"),
+    ("MTR", "Agitator Motor"), ("TRIP", "Pump Trip Alarm"), ("HTR", "Heater"),
+]
+
+
+def make_tag_rows(n, tanks=20, seed=0):
+    """Rows shaped like ABB_Tag_List.xlsx (Tank, Inputs/Output, Tag, Description, IO_Type)"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        io_type = rng.choice(IO_TYPES)
+        code, desc = rng.choice(EQUIPMENT)
+        tank = f"Tank {i % tanks + 1}"
+        rows.append({
+            "Tank": tank,
+            "Inputs/Output": "Input" if io_type.endswith("In") else "Output",
+            "Tag": f"{PREFIX[io_type]}_{code}_T{i % tanks + 1:02d}_{i:06d}",
+            "Description": f"{desc} {tank}",
+            "IO_Type": io_type,
+        })
+    return rows
+
+
+def make_variables(n, tanks=20, seed=0):
+    """Parsed variable dicts, as returned by parse_excel"""
+    from utils.excel_parser import TYPE_MAP
+
+    return [{
+        "name": row["Tag"],
+        "type": TYPE_MAP.get(row["IO_Type"], "BOOL"),
+        "comment": row["Description"],
+        "tank": row["Tank"],
+        "io_type": row["IO_Type"],
+    } for row in make_tag_rows(n, tanks, seed)]
+
+
+def write_tag_file(path, n, tanks=20, seed=0):
+    """Write a synthetic tag list; the format follows the file extension"""
+    df = pd.DataFrame(make_tag_rows(n, tanks, seed))
+    if str(path).endswith(".csv"):
+        df.to_csv(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+    return path
+
+
+def make_llm_output(n_vars, n_statements=None, seed=0):
+    """ST text in the shape the generation prompt asks for"""
+    rng = random.Random(seed)
+    n_statements = n_statements or n_vars
+    lines = ["VAR"]
+    for i in range(n_vars):
+        var_type = rng.choice(["BOOL", "REAL"])
+        lines.append(f"    Var_{i:05d} : {var_type}; (* synthetic variable {i} *)")
+    lines.append("END_VAR")
+    lines.append("")
+    for i in range(n_statements):
+        a, b = rng.randrange(n_vars), rng.randrange(n_vars)
+        lines.append(f"IF Var_{a:05d} THEN")
+        lines.append(f"    Var_{b:05d} := TRUE;")
+        lines.append("END_IF;")
+    return "\n".join(lines)
+
+
+def make_chat_history(n_messages, words_per_message=60, seed=0):
+    rng = random.Random(seed)
+    vocab = ["pump", "valve", "tank", "level", "start", "stop", "when", "high", "low",
+             "pressure", "alarm", "open", "close", "the", "and", "should", "motor"]
+    history = []
+    for i in range(n_messages):
+        history.append({
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": " ".join(rng.choice(vocab) for _ in range(words_per_message)),
+            "timestamp": f"2025-01-01 10:{i // 60 % 60:02d}:{i % 60:02d}",
+        })
+    return history
+
+
+def make_context(variables):
+    """Reconciled context rows (the /api/generate `context` shape)"""
+    return [{
+        "tag": v["name"],
+        "io_type": v["io_type"],
+        "description": v["comment"],
+        "type": v["type"],
+        "tank": v["tank"],
+    } for v in variables]
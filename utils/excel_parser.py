@@ -1,5 +1,8 @@
+import os
 import pandas as pd
 
+from utils.tag_formats import EXPORT_FORMATS, detect_format
+
 TYPE_MAP = {
     "Analog In": "REAL",
     "Analog Out": "REAL",
@@ -7,28 +10,151 @@ TYPE_MAP = {
     "Digital Out": "BOOL"
 }
 
-def parse_excel(file_path="variable1.xlsx"):
-    df = pd.read_excel(file_path)
-    df = df.rename(columns=lambda x: x.strip())
-
-    variables = []
-    for _, row in df.iterrows():
-        tag = str(row["Tag"]).strip() if pd.notna(row["Tag"]) else ""
-        io_type = str(row["IO_Type"]).strip() if pd.notna(row["IO_Type"]) else ""
-        desc = str(row["Description"]).strip() if pd.notna(row["Description"]) else ""
-        tank = str(row["Tank"]).strip() if "Tank" in df.columns and pd.notna(row["Tank"]) else ""
-        io = str(row["Inputs/Output"]).strip() if "Inputs/Output" in df.columns and pd.notna(row["Inputs/Output"]) else ""
-
-        if not tag or not io_type:
-            continue
-
-        st_type = TYPE_MAP.get(io_type, "BOOL")
-
-        variables.append({
-            "name": tag,
-            "type": st_type,
-            "comment": desc,
-            "tank": tank,
-            "io_type": io_type
-        })
-    return variables
+# Workbooks larger than this are read row-by-row through openpyxl's read-only
+# mode instead of being loaded into a single DataFrame.
+STREAMING_THRESHOLD_BYTES = 5 * 1024 * 1024
+STREAMING_CHUNK_ROWS = 10000
+
+TAG_COLUMNS = ["Tag", "IO_Type", "Description", "Tank"]
+
+
+def parse_excel(file_path="variable1.xlsx", streaming=None):
+    """Parse a tag-list workbook into variable dicts.
+
+    If streaming is None the path is chosen from the file size.
+    """
+    if streaming is None:
+        streaming = os.path.getsize(file_path) >= STREAMING_THRESHOLD_BYTES
+
+    if streaming:
+        variables = []
+        for chunk in iter_excel_chunks(file_path):
+            variables.extend(frame_to_variables(chunk))
+        return variables
+
+    df = pd.read_excel(file_path, dtype=str, usecols=_wanted_columns)
+    return frame_to_variables(df)
+
+
+def _wanted_columns(column):
+    return str(column).strip() in TAG_COLUMNS
+
+
+def iter_excel_chunks(file_path, chunk_rows=STREAMING_CHUNK_ROWS):
+    """Yield DataFrames of at most chunk_rows rows using openpyxl read-only mode"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        # The first sheet, as pd.read_excel reads it, not whichever was active on save
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = ["" if h is None else str(h).strip() for h in header]
+        keep = [i for i, h in enumerate(header) if h in TAG_COLUMNS]
+        columns = [header[i] for i in keep]
+
+        buffer = []
+        for row in rows:
+            buffer.append([row[i] if i < len(row) else None for i in keep])
+            if len(buffer) >= chunk_rows:
+                yield pd.DataFrame(buffer, columns=columns, dtype=object)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns, dtype=object)
+    finally:
+        wb.close()
+
+
+def _clean_column(df, name):
+    """Return column `name` as stripped strings with blanks for missing values"""
+    if name not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    col = df[name]
+    return col.where(col.notna(), "").astype(str).str.strip()
+
+
+def frame_to_variables(df):
+    """Convert a tag-list DataFrame into variable dicts using whole-column operations"""
+    df = df.rename(columns=lambda x: str(x).strip())
+
+    tag = _clean_column(df, "Tag")
+    io_type = _clean_column(df, "IO_Type")
+    keep = (tag != "") & (io_type != "")
+
+    out = pd.DataFrame({
+        "name": tag[keep],
+        "type": io_type[keep].map(TYPE_MAP).fillna("BOOL"),
+        "comment": _clean_column(df, "Description")[keep],
+        "tank": _clean_column(df, "Tank")[keep],
+        "io_type": io_type[keep]
+    })
+    return out.to_dict("records")
+
+
+def parse_tag_file(file_path):
+    """Parse a tag list in any supported format (Excel, CSV, Parquet, Feather)"""
+    fmt = detect_format(file_path)
+    if fmt == "excel":
+        return parse_excel(file_path)
+    if fmt == "csv":
+        return parse_csv(file_path)
+    return parse_arrow(file_path, fmt)
+
+
+def parse_csv(file_path, streaming=None):
+    """Parse a CSV tag list; large files are read in chunks"""
+    if streaming is None:
+        streaming = os.path.getsize(file_path) >= STREAMING_THRESHOLD_BYTES
+
+    options = {"dtype": str, "usecols": _wanted_columns, "skipinitialspace": True}
+    if streaming:
+        variables = []
+        for chunk in pd.read_csv(file_path, chunksize=STREAMING_CHUNK_ROWS, **options):
+            variables.extend(frame_to_variables(chunk))
+        return variables
+    return frame_to_variables(pd.read_csv(file_path, **options))
+
+
+def parse_arrow(file_path, fmt):
+    """Parse a Parquet or Feather tag list, reading only the tag columns (needs pyarrow)"""
+    try:
+        import pyarrow.feather as feather
+        import pyarrow.parquet as parquet
+    except ImportError:
+        raise ValueError(f"Reading {fmt} tag lists requires pyarrow")
+
+    if fmt == "parquet":
+        names = parquet.read_schema(file_path).names
+        table = parquet.read_table(file_path, columns=[n for n in names if _wanted_columns(n)])
+    else:
+        table = feather.read_table(file_path)
+        table = table.select([n for n in table.column_names if _wanted_columns(n)])
+    return frame_to_variables(table.to_pandas().astype(object))
+
+
+def variables_to_frame(variables):
+    """Parsed variables back in tag-list column layout"""
+    df = pd.DataFrame(variables, columns=["tank", "name", "comment", "io_type"])
+    return df.rename(columns={"tank": "Tank", "name": "Tag",
+                              "comment": "Description", "io_type": "IO_Type"})
+
+
+def export_tag_file(variables, fileobj, fmt="parquet"):
+    """Write parsed variables to fileobj as csv, parquet or feather"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    df = variables_to_frame(variables)
+    if fmt == "csv":
+        fileobj.write(df.to_csv(index=False).encode("utf-8"))
+        return
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ValueError(f"Writing {fmt} tag lists requires pyarrow")
+    if fmt == "parquet":
+        df.to_parquet(fileobj, index=False)
+    else:
+        df.to_feather(fileobj)
+
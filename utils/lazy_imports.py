@@ -0,0 +1,67 @@
+import importlib
+import sys
+import threading
+import time
+
+
+class LazyImporter:
+    """Imports heavy subsystems on first use and records what each cost.
+
+    `subsystems` maps a subsystem name to the module that provides it. The
+    recorded time is that of the first load in this process, so a shared
+    dependency (e.g. pandas) is charged to whichever subsystem pulls it in
+    first.
+    """
+
+    def __init__(self, subsystems):
+        self.subsystems = dict(subsystems)
+        self.startup_ms = None
+        self._import_ms = {}
+        self._lock = threading.Lock()
+
+    def load(self, name):
+        """The module behind subsystem `name`, importing it if needed"""
+        module_name = self.subsystems[name]
+        module = sys.modules.get(module_name)
+        if module is not None and name in self._import_ms:
+            return module
+        with self._lock:
+            if name not in self._import_ms:
+                start = time.perf_counter()
+                importlib.import_module(module_name)
+                self._import_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+        return sys.modules[module_name]
+
+    def preload(self, names):
+        """Load the given subsystems on a background thread"""
+        names = [name for name in names if name in self.subsystems]
+        if not names:
+            return None
+
+        def run():
+            for name in names:
+                try:
+                    self.load(name)
+                except ImportError:
+                    pass
+
+        thread = threading.Thread(target=run, name="preload-subsystems", daemon=True)
+        thread.start()
+        return thread
+
+    def record_startup(self, start):
+        """Note how long module-level startup took since perf_counter() `start`"""
+        self.startup_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    def report(self):
+        return {
+            "startup_ms": self.startup_ms,
+            "subsystems": {
+                name: {
+                    "module": module_name,
+                    "loaded": name in self._import_ms,
+                    "import_ms": self._import_ms.get(name),
+                }
+                for name, module_name in self.subsystems.items()
+            },
+        }
@@ -0,0 +1,240 @@
+import random
+import re
+import threading
+import time
+
+
+class ModelBusyError(RuntimeError):
+    """Raised when no model slot frees up within the queue timeout"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call's deadline passes before it could complete"""
+
+
+class GeminiBackend:
+    """Google Gemini through google.generativeai"""
+
+    def __init__(self, model_name, api_key=None):
+        import google.generativeai as genai
+
+        if api_key:
+            genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def retryable_errors(self):
+        try:
+            from google.api_core import exceptions
+        except ImportError:
+            return (ConnectionError, TimeoutError)
+        return (
+            ConnectionError,
+            TimeoutError,
+            exceptions.ResourceExhausted,
+            exceptions.ServiceUnavailable,
+            exceptions.DeadlineExceeded,
+            exceptions.InternalServerError,
+        )
+
+    def generate(self, prompt, timeout):
+        response = self.model.generate_content(prompt, request_options={"timeout": timeout})
+        return response.text
+
+    def stream(self, prompt, timeout):
+        response = self.model.generate_content(
+            prompt, stream=True, request_options={"timeout": timeout})
+        for chunk in response:
+            yield chunk.text
+
+
+class MockBackend:
+    """Deterministic offline stand-in for load and latency testing.
+
+    Generation prompts get a small ST program built from the first variables
+    listed under EXISTING VARIABLES; repair prompts get a VAR block declaring
+    each name reported as undeclared; clarification prompts get a question
+    until the conversation has two user turns, then a READY reply. `latency`
+    seconds are spent before the first chunk, and streamed output is split
+    into `stream_chunks` pieces. A fixed `canned` reply overrides both.
+    """
+
+    VAR_LINE_RE = re.compile(r"^- (\w+) \((\w+)\): (.*?) \[", re.MULTILINE)
+    UNDECLARED_RE = re.compile(r"^- '(\w+)' is used but not declared", re.MULTILINE)
+
+    def __init__(self, model_name="mock", latency=0.0, stream_chunks=8, canned=None):
+        self.model_name = model_name
+        self.latency = latency
+        self.stream_chunks = max(1, stream_chunks)
+        self.canned = canned
+
+    def retryable_errors(self):
+        return ()
+
+    def reply_for(self, prompt):
+        if self.canned is not None:
+            return self.canned
+        if "REPAIR REQUEST" in prompt:
+            names = self.UNDECLARED_RE.findall(prompt)
+            return "\n".join(["VAR"] + [f"    {name} : BOOL; (* Mock repair *)" for name in names] + ["END_VAR"])
+        if "EXISTING VARIABLES:" in prompt:
+            return self._st_program(prompt)
+        if len(re.findall(r"^user:", prompt, re.MULTILINE)) >= 2:
+            return "READY: Mock summary of the requested control logic."
+        return "What equipment should be controlled, and which condition should trigger it?"
+
+    def _st_program(self, prompt):
+        existing = self.VAR_LINE_RE.findall(prompt)[:3]
+        lines = ["VAR"]
+        for name, var_type, comment in existing:
+            lines.append(f"    {name} : {var_type}; (* {comment} *)")
+        lines.append("    Mock_Output : BOOL; (* Mock generated output *)")
+        lines.append("END_VAR")
+        lines.append("")
+
+        condition = next((name for name, var_type, _ in existing if var_type == "BOOL"), None)
+        if condition is None and existing:
+            condition = f"{existing[0][0]} > 0.0"
+        lines.append(f"IF {condition or 'TRUE'} THEN")
+        lines.append("    Mock_Output := TRUE;")
+        lines.append("ELSE")
+        lines.append("    Mock_Output := FALSE;")
+        lines.append("END_IF;")
+        return "\n".join(lines)
+
+    def generate(self, prompt, timeout):
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+        return self.reply_for(prompt)
+
+    def stream(self, prompt, timeout):
+        text = self.reply_for(prompt)
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+        size = max(1, -(-len(text) // self.stream_chunks))
+        for start in range(0, len(text), size):
+            yield text[start:start + size]
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "mock": MockBackend,
+}
+
+
+def create_backend(name, model_name, **options):
+    """Instantiate the backend registered under `name`"""
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM backend: {name}")
+    return backend_cls(model_name, **options)
+
+
+class ModelClient:
+    """Process-wide wrapper around a single model backend.
+
+    The backend (and the transport behind it) is created once and reused, so
+    connections stay alive between requests. A semaphore caps the number of
+    in-flight calls; callers that cannot get a slot within queue_timeout get
+    ModelBusyError instead of piling up. Transient upstream errors are retried
+    with exponential backoff and jitter, and every call carries a timeout.
+    """
+
+    def __init__(self, backend_factory, max_concurrency=8, timeout=60, max_retries=2,
+                 backoff_base=0.5, backoff_max=8.0, queue_timeout=30):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._backend_factory = backend_factory
+        self._backend = None
+        self._backend_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = self._backend_factory()
+        return self._backend
+
+    @property
+    def model_name(self):
+        return self.backend.model_name
+
+    @staticmethod
+    def _remaining(deadline):
+        """Seconds left before a time.monotonic() deadline (None = no deadline)"""
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Model call deadline passed")
+        return remaining
+
+    def _acquire(self, deadline=None):
+        remaining = self._remaining(deadline)
+        wait = self.queue_timeout if remaining is None else min(self.queue_timeout, remaining)
+        if not self._slots.acquire(timeout=wait):
+            if remaining is not None and wait == remaining:
+                raise DeadlineExceeded("Model call deadline passed while waiting for a slot")
+            raise ModelBusyError("Model is busy, try again shortly")
+
+    def _backoff(self, attempt, deadline=None):
+        """Sleep before a retry; False when the deadline leaves no time for one"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return False
+        time.sleep(delay)
+        return True
+
+    def _call_timeout(self, deadline):
+        remaining = self._remaining(deadline)
+        return self.timeout if remaining is None else min(self.timeout, remaining)
+
+    def generate(self, prompt, deadline=None):
+        """Return the full response text for prompt
+
+        `deadline` (a time.monotonic() value) bounds the whole call: the wait
+        for a slot, every attempt's timeout and the backoff between retries.
+        """
+        backend = self.backend
+        retryable = backend.retryable_errors()
+        self._acquire(deadline)
+        try:
+            attempt = 0
+            while True:
+                try:
+                    return backend.generate(prompt, self._call_timeout(deadline))
+                except retryable:
+                    if attempt >= self.max_retries or not self._backoff(attempt, deadline):
+                        raise
+                    attempt += 1
+        finally:
+            self._slots.release()
+
+    def stream(self, prompt):
+        """Yield response text chunks; retries only happen before the first chunk"""
+        backend = self.backend
+        retryable = backend.retryable_errors()
+        self._acquire()
+        try:
+            attempt = 0
+            while True:
+                started = False
+                try:
+                    for text in backend.stream(prompt, self.timeout):
+                        if text:
+                            started = True
+                            yield text
+                    return
+                except retryable:
+                    if started or attempt >= self.max_retries:
+                        raise
+                    self._backoff(attempt)
+                    attempt += 1
+        finally:
+            self._slots.release()
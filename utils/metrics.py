@@ -0,0 +1,142 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# name -> (type, help, buckets)
+STANDARD_METRICS = {
+    "plc_request_duration_seconds": ("histogram", "HTTP request latency by endpoint", DURATION_BUCKETS),
+    "plc_requests_total": ("counter", "HTTP requests by endpoint and status", None),
+    "plc_stage_duration_seconds": ("histogram", "Latency of traced stages inside a request", DURATION_BUCKETS),
+    "plc_stage_errors_total": ("counter", "Exceptions raised inside traced stages", None),
+    "plc_payload_chars": ("histogram", "Prompt and model response sizes in characters", SIZE_BUCKETS),
+    "plc_tag_cache_requests_total": ("counter", "Parsed tag-list cache lookups by result", None),
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus layout"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms rendered as Prometheus text.
+
+    Collectors registered with add_collector are called at render time and
+    return (name, type, help, [(labels_dict, value), ...]) tuples, which is
+    how components that keep their own statistics (e.g. the response cache)
+    are exported without double bookkeeping.
+    """
+
+    def __init__(self, metrics=STANDARD_METRICS):
+        self._lock = threading.Lock()
+        self._meta = dict(metrics)
+        self._series = {name: {} for name in self._meta}
+        self._collectors = []
+
+    def inc(self, name, labels=None, amount=1):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            series = self._series[name]
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            series = self._series[name]
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(self._meta[name][2])
+            hist.observe(value)
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, _) in self._meta.items():
+                series = self._series[name]
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series.items()):
+                    if kind == "histogram":
+                        cumulative = 0
+                        for bound, count in zip(value.buckets + ("+Inf",), value.counts):
+                            cumulative += count
+                            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value.sum)}")
+                        lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+                    else:
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """Stage timings for one unit of work (a request or one batch item).
+
+    Every stage is recorded in the registry's stage histogram; `timings`
+    keeps this trace's own milliseconds per stage for Server-Timing.
+    """
+
+    def __init__(self, registry, endpoint):
+        self.registry = registry
+        self.endpoint = endpoint
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.registry.inc("plc_stage_errors_total", {"endpoint": self.endpoint, "stage": name})
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed * 1000
+            self.registry.observe("plc_stage_duration_seconds", elapsed,
+                                  {"endpoint": self.endpoint, "stage": name})
+
+    def size(self, kind, chars):
+        """Record a prompt or response size"""
+        self.registry.observe("plc_payload_chars", chars, {"endpoint": self.endpoint, "kind": kind})
@@ -0,0 +1,532 @@
+from reportlab.lib.pagesizes import letter, A4
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+from reportlab.platypus.tableofcontents import TableOfContents
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+from reportlab.pdfgen import canvas
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Preformatted
+import textwrap
+import tempfile
+import time
+from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
+
+# Rendered reports stay in memory up to this size, then spill to an anonymous temp file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+# Chat messages longer than this are cut in the history and printed whole in the appendix
+MAX_MESSAGE_CHARS = 4000
+# Context variables per table; each chunk repeats the header row
+TABLE_CHUNK_ROWS = 50
+
+def generate_session_report_pdf(session_data, spool_max_bytes=SPOOL_MAX_BYTES, timings=None,
+                                max_message_chars=MAX_MESSAGE_CHARS, table_chunk_rows=TABLE_CHUNK_ROWS,
+                                message_appendix=True):
+    """
+    Generate a comprehensive PDF document for PLC code generation session
+    
+    Returns a file object positioned at the start of the PDF. Small reports
+    are held in memory; larger ones spill to a temp file that is deleted when
+    the returned object is closed, so callers must close it.
+
+    If a `timings` dict is passed it is filled with milliseconds spent per
+    section (building the flowables plus laying them out and drawing them),
+    and 'finalize' for closing the document.
+
+    chat_history and retrieved_context may be any iterables; they are read
+    once, message by message and row by row. Context tables are split into
+    chunks of table_chunk_rows rows. Messages over max_message_chars are
+    truncated in the history and, with message_appendix, printed in full in
+    an appendix.
+
+    session_data should contain:
+    - operator_name: str
+    - session_start_time: datetime
+    - session_end_time: datetime
+    - chat_history: list of messages
+    - generated_code: dict with 'vars' and 'logic'
+    - retrieved_context: list of variables
+    - mode: str ('excel' or 'user')
+    - clarification_summary: str
+    """
+    
+    # Render into a spooled buffer
+    buffer = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    
+    # Create PDF document
+    doc = TimedDocTemplate(
+        buffer,
+        pagesize=A4,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=18
+    )
+    
+    # Shared styles, built once per process
+    theme = get_report_theme()
+    
+    # Build document content, tagging each flowable with its section
+    story = []
+    section_ms = {}
+    truncated = []
+    sections = [
+        ('header', lambda: add_pdf_header_section(story, session_data, theme)),
+        ('overview', lambda: add_pdf_session_overview(story, session_data, theme)),
+        ('chat_history', lambda: add_pdf_chat_history_section(story, session_data, theme,
+                                                              max_message_chars, truncated)),
+        ('generated_code', lambda: add_pdf_generated_code_section(story, session_data, theme)),
+        ('retrieved_context', lambda: add_pdf_retrieved_context_section(story, session_data, theme,
+                                                                        table_chunk_rows)),
+        ('clarification', lambda: add_pdf_clarification_section(story, session_data, theme)),
+        ('appendix', lambda: add_pdf_message_appendix_section(story, truncated, theme,
+                                                              max_message_chars, message_appendix)),
+        ('footer', lambda: add_pdf_footer_section(story, theme)),
+    ]
+    for name, add_section in sections:
+        start = time.perf_counter()
+        first = len(story)
+        add_section()
+        for flowable in story[first:]:
+            flowable._report_section = name
+        section_ms[name] = (time.perf_counter() - start) * 1000
+    
+    # Build PDF
+    start = time.perf_counter()
+    try:
+        doc.build(story)
+    except Exception:
+        buffer.close()
+        raise
+    build_ms = (time.perf_counter() - start) * 1000
+    
+    if timings is not None:
+        for name, ms in section_ms.items():
+            timings[name] = ms + doc.section_ms.get(name, 0.0)
+        timings['finalize'] = max(0.0, build_ms - sum(doc.section_ms.values()))
+    
+    buffer.seek(0)
+    return buffer
+
+
+class TimedDocTemplate(SimpleDocTemplate):
+    """SimpleDocTemplate that attributes layout/draw time to report sections"""
+
+    def beforeDocument(self):
+        self.section_ms = {}
+        self._section = None
+        self._tick = time.perf_counter()
+
+    def afterFlowable(self, flowable):
+        # Split parts of a table carry no tag; they belong to the current section
+        self._section = getattr(flowable, '_report_section', self._section)
+        now = time.perf_counter()
+        key = self._section or 'header'
+        self.section_ms[key] = self.section_ms.get(key, 0.0) + (now - self._tick) * 1000
+        self._tick = now
+
+
+class ReportTheme:
+    """Paragraph and table styles shared by all report section builders"""
+
+    def __init__(self):
+        self.styles = MappingProxyType(create_custom_styles(getSampleStyleSheet()))
+
+        self.code = ParagraphStyle(
+            'PreformattedCode',
+            parent=self.styles['code'],
+            fontName='Courier',
+            fontSize=8,
+            leading=10,
+            leftIndent=10,
+            rightIndent=10,
+            spaceBefore=6,
+            spaceAfter=6
+        )
+
+        self.overview_table = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a5568')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
+        ])
+
+        self.context_table = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4a5568')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('TOPPADDING', (0, 1), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 1), (-1, -1), 4),
+            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#e2e8f0')),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')]),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP')
+        ])
+
+        self.footer_line = TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8)
+        ])
+
+
+@lru_cache(maxsize=None)
+def get_report_theme():
+    """The process-wide ReportTheme, created on first use"""
+    return ReportTheme()
+
+def create_custom_styles(base_styles):
+    """Create custom styles for the PDF"""
+    custom_styles = {}
+    
+    # Title style
+    custom_styles['title'] = ParagraphStyle(
+        'CustomTitle',
+        parent=base_styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=TA_CENTER,
+        textColor=colors.HexColor('#1a365d')
+    )
+    
+    # Heading style
+    custom_styles['heading'] = ParagraphStyle(
+        'CustomHeading',
+        parent=base_styles['Heading2'],
+        fontSize=14,
+        spaceBefore=20,
+        spaceAfter=12,
+        textColor=colors.HexColor('#2d3748')
+    )
+    
+    # Subheading style
+    custom_styles['subheading'] = ParagraphStyle(
+        'CustomSubheading',
+        parent=base_styles['Heading3'],
+        fontSize=12,
+        spaceBefore=15,
+        spaceAfter=8,
+        textColor=colors.HexColor('#4a5568')
+    )
+    
+    # Code style
+    custom_styles['code'] = ParagraphStyle(
+    'CodeStyle',
+    parent=base_styles['Code'],
+    fontSize=9,
+    leftIndent=20,
+    fontName='Courier',
+    backColor=colors.HexColor('#f7fafc'),
+    borderColor=colors.HexColor('#e2e8f0'),
+    borderWidth=1,
+    borderPadding=8,
+    spaceBefore=6,
+    spaceAfter=6,
+    alignment=TA_LEFT,
+    wordWrap='LTR'  # Add word wrap control
+)
+    
+    # Normal text
+    custom_styles['normal'] = ParagraphStyle(
+        'CustomNormal',
+        parent=base_styles['Normal'],
+        fontSize=10,
+        spaceAfter=6
+    )
+    
+    # Chat styles
+    custom_styles['chat_user'] = ParagraphStyle(
+        'ChatUser',
+        parent=base_styles['Normal'],
+        fontSize=9,
+        leftIndent=20,
+        backColor=colors.HexColor('#e6f3ff'),
+        borderColor=colors.HexColor('#3182ce'),
+        borderWidth=1,
+        borderPadding=5
+    )
+    
+    custom_styles['chat_bot'] = ParagraphStyle(
+        'ChatBot',
+        parent=base_styles['Normal'],
+        fontSize=9,
+        leftIndent=20,
+        backColor=colors.HexColor('#f0fff4'),
+        borderColor=colors.HexColor('#38a169'),
+        borderWidth=1,
+        borderPadding=5
+    )
+    
+    return custom_styles
+
+def add_pdf_header_section(story, session_data, theme):
+    """Add PDF header with title and basic info"""
+    
+    # Main title
+    title = Paragraph('PLC Code Generation Session Report', theme.styles['title'])
+    story.append(title)
+    
+    # Subtitle
+    subtitle = Paragraph('IEC 61131-3 Structured Text Code Generator', theme.styles['normal'])
+    subtitle.alignment = TA_CENTER
+    story.append(subtitle)
+    
+    story.append(Spacer(1, 20))
+
+def add_pdf_session_overview(story, session_data, theme):
+    """Add session overview table"""
+    
+    story.append(Paragraph('Session Overview', theme.styles['heading']))
+    
+    # Create overview data
+    overview_data = [
+        ['Parameter', 'Value'],
+        ['Operator Name', session_data.get('operator_name', 'Not specified')],
+        ['Session Start Time', format_datetime(session_data.get('session_start_time'))],
+        ['Session End Time', format_datetime(session_data.get('session_end_time'))],
+        ['Duration', calculate_duration(session_data.get('session_start_time'), 
+                                      session_data.get('session_end_time'))],
+        ['Generation Mode', session_data.get('mode', 'User-defined').title()],
+        ['Total Chat Messages', count_label(session_data.get('chat_history', []))],
+        ['Variables Retrieved', count_label(session_data.get('retrieved_context', []))]
+    ]
+    
+    # Create table
+    table = Table(overview_data, colWidths=[2*inch, 4*inch])
+    table.setStyle(theme.overview_table)
+    
+    story.append(table)
+    story.append(Spacer(1, 20))
+
+def add_pdf_chat_history_section(story, session_data, theme, max_message_chars, truncated):
+    """Add complete chat history
+
+    Messages longer than max_message_chars are cut; (number, header, content)
+    of each cut message is appended to `truncated` for the appendix.
+    """
+    
+    story.append(Paragraph('Chat History', theme.styles['heading']))
+    
+    # Add each message as a formatted paragraph
+    count = 0
+    for i, message in enumerate(session_data.get('chat_history', []) or []):
+        count += 1
+        role = message.get('role', 'Unknown').capitalize()
+        content = str(message.get('content', ''))
+        timestamp = message.get('timestamp', 'N/A')
+        
+        # Create header for each message
+        msg_header = f"<b>[{timestamp}] {role}:</b>"
+        story.append(Paragraph(msg_header, theme.styles['normal']))
+        
+        # Choose style based on role
+        msg_style = theme.styles['chat_user'] if role.lower() == 'user' else theme.styles['chat_bot']
+        
+        # Cap very long messages so one message cannot dominate layout time
+        if len(content) > max_message_chars:
+            truncated.append((i + 1, msg_header, content))
+            content = content[:max_message_chars]
+            note = f" ... [truncated, full text in appendix as message {i + 1}]"
+        else:
+            note = ""
+        
+        # Wrap long content
+        wrapped_content = wrap_text(content, 80) + note
+        story.append(Paragraph(wrapped_content, msg_style))
+        story.append(Spacer(1, 8))
+    
+    if not count:
+        story.append(Paragraph('No chat history available.', theme.styles['normal']))
+        return
+    
+    story.append(Spacer(1, 15))
+
+def add_pdf_generated_code_section(story, session_data, theme):
+    """Add the generated code section with proper formatting"""
+    
+    story.append(Paragraph('Generated Code', theme.styles['heading']))
+    
+    generated_code = session_data.get('generated_code', {})
+    
+    # Variable Declarations
+    story.append(Paragraph('Variable Declarations', theme.styles['subheading']))
+    
+    vars_code = generated_code.get('vars', 'No variable declarations generated.')
+    if vars_code.strip():
+        # Use Preformatted class for code blocks
+        story.append(Preformatted(vars_code, theme.code))
+    else:
+        story.append(Paragraph('No variable declarations generated.', theme.styles['normal']))
+    
+    story.append(Spacer(1, 15))
+    
+    # Logic Code
+    story.append(Paragraph('Logic Code', theme.styles['subheading']))
+    
+    logic_code = generated_code.get('logic', 'No logic code generated.')
+    if logic_code.strip():
+        story.append(Preformatted(logic_code, theme.code))
+    else:
+        story.append(Paragraph('No logic code generated.', theme.styles['normal']))
+    
+    story.append(Spacer(1, 20))
+
+
+CONTEXT_HEADER = ['Tank', 'IO Type', 'Tag Name', 'Description', 'Data Type']
+
+def add_pdf_retrieved_context_section(story, session_data, theme, table_chunk_rows):
+    """Add retrieved context variables as a series of page-sized tables"""
+    
+    story.append(Paragraph('Retrieved Context Variables', theme.styles['heading']))
+    
+    rows = []
+    tables = 0
+    for var in session_data.get('retrieved_context', []) or []:
+        rows.append([
+            var.get('tank', ''),
+            var.get('io_type', ''),
+            var.get('tag', ''),
+            wrap_text(var.get('description', ''), 30),
+            var.get('type', '')
+        ])
+        if len(rows) >= table_chunk_rows:
+            story.append(context_table(rows, theme))
+            tables += 1
+            rows = []
+    if rows:
+        story.append(context_table(rows, theme))
+        tables += 1
+    
+    if not tables:
+        story.append(Paragraph('No context variables retrieved.', theme.styles['normal']))
+        return
+    
+    story.append(Spacer(1, 20))
+
+def context_table(rows, theme):
+    """One chunk of the context table; the header row repeats if it splits across pages"""
+    table = Table([CONTEXT_HEADER] + rows, colWidths=[0.8*inch, 1*inch, 1.2*inch, 2.2*inch, 0.8*inch],
+                  repeatRows=1)
+    table.setStyle(theme.context_table)
+    return table
+
+def add_pdf_clarification_section(story, session_data, theme):
+    """Add clarification summary"""
+    
+    story.append(Paragraph('Clarification Summary', theme.styles['heading']))
+    
+    clarification = session_data.get('clarification_summary', 
+                                   'No specific clarifications were recorded for this session.')
+    
+    # Split into paragraphs and add each
+    paragraphs = clarification.split('\n\n')
+    for para in paragraphs:
+        if para.strip():
+            wrapped_para = wrap_text(para.strip(), 100)
+            story.append(Paragraph(wrapped_para, theme.styles['normal']))
+            story.append(Spacer(1, 8))
+
+def add_pdf_message_appendix_section(story, truncated, theme, max_message_chars, enabled):
+    """Add the full text of chat messages that were truncated in the history"""
+    if not truncated or not enabled:
+        return
+    
+    story.append(Paragraph('Appendix: Full Chat Messages', theme.styles['heading']))
+    
+    for number, msg_header, content in truncated:
+        story.append(Paragraph(f"Message {number} {msg_header}", theme.styles['normal']))
+        # Emit the text in max_message_chars pieces so no single paragraph gets huge
+        for start in range(0, len(content), max_message_chars):
+            story.append(Paragraph(wrap_text(content[start:start + max_message_chars], 100),
+                                   theme.styles['normal']))
+        story.append(Spacer(1, 8))
+
+def add_pdf_footer_section(story, theme):
+    """Add footer with generation timestamp"""
+    
+    story.append(Spacer(1, 30))
+    
+    # Horizontal line
+    line_data = [['_' * 80]]
+    line_table = Table(line_data)
+    line_table.setStyle(theme.footer_line)
+    story.append(line_table)
+    
+    story.append(Spacer(1, 10))
+    
+    # Footer text
+    footer_text = f"Report generated on {datetime.now().strftime('%Y-%m-%d at %H:%M:%S')}"
+    footer_para = Paragraph(footer_text, theme.styles['normal'])
+    footer_para.alignment = TA_CENTER
+    story.append(footer_para)
+
+# Utility functions
+def format_datetime(dt):
+    """Format datetime object to string"""
+    if dt is None:
+        return 'Not recorded'
+    if isinstance(dt, str):
+        return dt
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+def calculate_duration(start_time, end_time):
+    """Calculate session duration"""
+    if start_time is None or end_time is None:
+        return 'Not calculated'
+    
+    try:
+        if isinstance(start_time, str):
+            start_time = datetime.fromisoformat(start_time)
+        if isinstance(end_time, str):
+            end_time = datetime.fromisoformat(end_time)
+        
+        duration = end_time - start_time
+        total_seconds = int(duration.total_seconds())
+        hours, remainder = divmod(total_seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        
+        if hours > 0:
+            return f"{hours}h {minutes}m {seconds}s"
+        elif minutes > 0:
+            return f"{minutes}m {seconds}s"
+        else:
+            return f"{seconds}s"
+            
+    except Exception:
+        return 'Not calculated'
+
+def count_label(items):
+    """Item count for the overview table; one-shot iterators cannot be counted up front"""
+    try:
+        return str(len(items))
+    except TypeError:
+        return 'See section below'
+
+def wrap_text(text, width):
+    """Wrap text to specified width"""
+    if not text:
+        return ""
+    return "<br/>".join(textwrap.wrap(str(text), width))
+
+def escape_html(text):
+    """Escape HTML characters in text"""
+    if not text:
+        return ""
+    text = str(text)
+    text = text.replace('&', '&amp;')
+    text = text.replace('<', '&lt;')
+    text = text.replace('>', '&gt;')
+    text = text.replace('"', '&quot;')
+    text = text.replace("'", '&#x27;')
+    return text
@@ -0,0 +1,143 @@
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+JOB_ID_LEN = 32
+
+
+def _pool_context():
+    """forkserver where available (spawn on Windows/macOS builds without it)
+
+    Forking the threaded web process could copy a lock held by another
+    thread into the worker; a clean interpreter cannot deadlock that way.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def render_report_job(session_data, pdf_path, error_path, timing_path, render_options):
+    """Worker-process entry point: render the report and move it into place"""
+    from utils.pdf_report import generate_session_report_pdf
+
+    try:
+        timings = {}
+        with generate_session_report_pdf(session_data, timings=timings, **render_options) as rendered:
+            with open(pdf_path + ".tmp", "wb") as out:
+                shutil.copyfileobj(rendered, out)
+        with open(timing_path, "w") as fh:
+            json.dump(timings, fh)
+        os.replace(pdf_path + ".tmp", pdf_path)
+    except Exception as e:
+        with open(error_path, "w") as fh:
+            fh.write(f"{e}\n{traceback.format_exc()}")
+
+
+class ReportJobQueue:
+    """PDF report rendering on a process pool.
+
+    Job state lives in `directory` as <id>.json (metadata), <id>.pdf (result),
+    <id>.timing (per-section render ms) and <id>.err (failure), so any worker process that shares the directory
+    can answer status and download requests. Finished jobs older than ttl
+    seconds are removed when new jobs are submitted.
+    """
+
+    def __init__(self, directory, max_workers=None, ttl=3600, render_options=None):
+        # Absolute, so result paths stay valid for send_file whatever the cwd
+        self.directory = os.path.abspath(directory)
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.render_options = render_options or {}
+        self._pool = None
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=_pool_context())
+        return self._pool
+
+    def _path(self, job_id, ext):
+        return os.path.join(self.directory, f"{job_id}.{ext}")
+
+    def submit(self, session_data, filename):
+        """Queue a report and return its job id"""
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        with open(self._path(job_id, "json"), "w") as fh:
+            json.dump({"filename": filename, "submitted": time.time()}, fh)
+        future = self.pool.submit(render_report_job, session_data, self._path(job_id, "pdf"),
+                                  self._path(job_id, "err"), self._path(job_id, "timing"),
+                                  self.render_options)
+        future.add_done_callback(lambda f: self._record_failure(f, job_id))
+        return job_id
+
+    def _record_failure(self, future, job_id):
+        """Write <id>.err when the job died outside render_report_job (e.g. a killed worker)"""
+        if future.cancelled():
+            error = "cancelled"
+        else:
+            error = future.exception()
+            if error is None:
+                return
+        if isinstance(error, BrokenProcessPool):
+            # The pool cannot run anything else; start a fresh one on the next submit
+            with self._lock:
+                self._pool = None
+        err_path = self._path(job_id, "err")
+        if not os.path.exists(self._path(job_id, "pdf")) and not os.path.exists(err_path):
+            with open(err_path, "w") as fh:
+                fh.write(f"Report worker failed: {error!r}\n")
+
+    def status(self, job_id):
+        """Job metadata plus status ('pending', 'done' or 'failed'), or None if unknown"""
+        if len(job_id) != JOB_ID_LEN or not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id, "json")) as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+        meta["job_id"] = job_id
+        if os.path.exists(self._path(job_id, "pdf")):
+            meta["status"] = "done"
+            try:
+                with open(self._path(job_id, "timing")) as fh:
+                    meta["timings_ms"] = json.load(fh)
+            except (OSError, ValueError):
+                pass
+        elif os.path.exists(self._path(job_id, "err")):
+            meta["status"] = "failed"
+            with open(self._path(job_id, "err")) as fh:
+                meta["error"] = fh.readline().strip()
+        else:
+            meta["status"] = "pending"
+        return meta
+
+    def result_path(self, job_id):
+        return self._path(job_id, "pdf")
+
+    def cleanup(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
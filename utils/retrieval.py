@@ -0,0 +1,33 @@
+def estimate_tokens(text):
+    """Rough token count for prompt budgeting (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def select_prompt_variables(user_request, index, matching_vars, top_k, token_budget, formatter):
+    """Pick the variables that go into the generation prompt.
+
+    Small tag lists (no more than top_k entries) are sent whole. Larger ones
+    are ranked with BM25 against the request; keyword matches from
+    find_matching_variables fill any remaining slots. Selection stops at
+    top_k variables or when the formatted lines would exceed token_budget.
+    """
+    if len(index) <= top_k:
+        candidates = index.variables()
+    else:
+        candidates = index.rank(user_request, top_k) + matching_vars
+
+    selected = []
+    seen = set()
+    used = 0
+    for var in candidates:
+        if len(selected) >= top_k:
+            break
+        if id(var) in seen:
+            continue
+        cost = estimate_tokens(formatter(var))
+        if used + cost > token_budget:
+            break
+        seen.add(id(var))
+        selected.append(var)
+        used += cost
+    return selected
@@ -0,0 +1,204 @@
+import pickle
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from utils.tag_cache import FIELDS, variables_digest
+from utils.tag_store import PartitionedTagIndex
+
+SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id):
+    return bool(session_id) and bool(SESSION_ID_RE.match(session_id))
+
+
+class SessionState:
+    """Everything one operator session keeps between requests"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.user_variables = []
+        self.uploaded_variables = []
+        self.last_context = []
+        self.user_index = PartitionedTagIndex()
+        self.uploaded_index = PartitionedTagIndex()
+        # Content digest of uploaded_variables; "" after an in-place change
+        # means unknown, and the SQLite store computes it when saving
+        self.uploaded_digest = ""
+        # Changes on every save so workers can tell whether their copy is current
+        self.revision = ""
+
+
+class InMemorySessionStore:
+    """Sessions held in this process only (single worker deployments).
+
+    Sessions idle for longer than idle_ttl seconds are dropped, and at most
+    max_sessions are kept, evicting the least recently used.
+    """
+
+    def __init__(self, idle_ttl=3600, max_sessions=1000):
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id):
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                state = SessionState(session_id)
+            else:
+                state = entry[0]
+            self._sessions[session_id] = (state, now)
+            self._sessions.move_to_end(session_id)
+            return state
+
+    def save(self, state):
+        state.revision = uuid.uuid4().hex
+        self.remember(state)
+
+    def remember(self, state):
+        """Store state as the current copy of its session"""
+        with self._lock:
+            self._sessions[state.session_id] = (state, time.time())
+            self._sessions.move_to_end(state.session_id)
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, (_, last_seen) = next(iter(self._sessions.items()))
+            if now - last_seen > self.idle_ttl or len(self._sessions) > self.max_sessions:
+                del self._sessions[session_id]
+            else:
+                break
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore:
+    """Sessions shared by every worker process through a SQLite file.
+
+    A session row holds only the small per-session fields (user variables,
+    last context and the uploaded tag list's digest). Uploaded tag lists are
+    stored once per digest in a separate table, so saving a session after
+    add_variable or generate never re-serializes a large tag list. Each
+    worker keeps the last state it saw per session and only reads the row
+    when the stored revision differs, i.e. another worker has saved since;
+    indexes are reused while the tag lists behind them are unchanged and
+    rebuilt otherwise. Concurrent writes to the same session are
+    last-writer-wins, sessions not saved for idle_ttl seconds are deleted
+    and tag lists no session references go with them.
+    """
+
+    def __init__(self, path, idle_ttl=3600, max_sessions=1000, sweep_interval=60):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._cache = InMemorySessionStore(idle_ttl, max_sessions)
+        self._last_sweep = 0.0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_state "
+                "(id TEXT PRIMARY KEY, revision TEXT NOT NULL, data BLOB NOT NULL, "
+                "uploaded_digest TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS tag_lists (digest TEXT PRIMARY KEY, data BLOB NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id):
+        now = time.time()
+        self._sweep(now)
+        conn = self._connect()
+        row = conn.execute("SELECT revision FROM session_state WHERE id = ?", (session_id,)).fetchone()
+        local = self._cache.load(session_id)
+        if row is None or row[0] == local.revision:
+            return local
+
+        data = conn.execute("SELECT revision, data, uploaded_digest FROM session_state WHERE id = ?",
+                            (session_id,)).fetchone()
+        if data is None:
+            return local
+        revision, blob, digest = data
+        fields = pickle.loads(blob)
+
+        state = SessionState(session_id)
+        state.revision = revision
+        state.last_context = fields["last_context"]
+        state.user_variables = fields["user_variables"]
+        if state.user_variables == local.user_variables:
+            state.user_index = local.user_index
+        else:
+            state.user_index = PartitionedTagIndex(state.user_variables)
+
+        state.uploaded_digest = digest
+        if digest == local.uploaded_digest:
+            state.uploaded_variables = local.uploaded_variables
+            state.uploaded_index = local.uploaded_index
+        elif digest:
+            state.uploaded_variables = self._load_tag_list(conn, digest)
+            state.uploaded_index = PartitionedTagIndex(state.uploaded_variables)
+        self._cache.remember(state)
+        return state
+
+    def _load_tag_list(self, conn, digest):
+        row = conn.execute("SELECT data FROM tag_lists WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return []
+        columns = pickle.loads(row[0])
+        return [dict(zip(FIELDS, values)) for values in zip(*(columns[f] for f in FIELDS))]
+
+    def save(self, state):
+        state.revision = uuid.uuid4().hex
+        if state.uploaded_variables and not state.uploaded_digest:
+            state.uploaded_digest = variables_digest(state.uploaded_variables)
+        digest = state.uploaded_digest if state.uploaded_variables else ""
+        fields = {"user_variables": state.user_variables, "last_context": state.last_context}
+        now = time.time()
+        with self._connect() as conn:
+            stored = digest and conn.execute("SELECT 1 FROM tag_lists WHERE digest = ?", (digest,)).fetchone()
+            if digest and not stored:
+                columns = {f: [v.get(f, "") for v in state.uploaded_variables] for f in FIELDS}
+                conn.execute("INSERT OR IGNORE INTO tag_lists (digest, data) VALUES (?, ?)",
+                             (digest, pickle.dumps(columns, protocol=pickle.HIGHEST_PROTOCOL)))
+            conn.execute(
+                "INSERT OR REPLACE INTO session_state (id, revision, data, uploaded_digest, updated) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (state.session_id, state.revision,
+                 pickle.dumps(fields, protocol=pickle.HIGHEST_PROTOCOL), digest, now),
+            )
+        self._cache.remember(state)
+
+    def _sweep(self, now):
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        with self._connect() as conn:
+            conn.execute("DELETE FROM session_state WHERE updated < ?", (now - self.idle_ttl,))
+            conn.execute("DELETE FROM tag_lists WHERE digest NOT IN "
+                         "(SELECT uploaded_digest FROM session_state)")
+
+
+def create_session_store(backend, path=None, idle_ttl=3600, max_sessions=1000):
+    """Build the session store named by `backend` ("memory" or "sqlite")"""
+    if backend == "memory":
+        return InMemorySessionStore(idle_ttl, max_sessions)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path, idle_ttl, max_sessions)
+    raise ValueError(f"Unknown session backend: {backend}")
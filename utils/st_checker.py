@@ -0,0 +1,292 @@
+"""Static checks for generated Structured Text against the reconciled context.
+
+Runs over the st_parser AST without a model round trip:
+
+- undeclared: a name used in the logic that is neither in the context nor
+  declared in the program
+- unused: a context variable the logic never references
+- type: BOOL used where a number is expected or the other way round
+  (assignments, conditions, logical and arithmetic operators)
+- input_write: an assignment to a tag-list variable whose io_type is an
+  input (context entries with "origin": "tag_list"; the io_type of names
+  the model invented is only guessed, so they are not checked)
+
+Each diagnostic is {"severity", "code", "line", "message", "tag"}.
+"""
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from utils.st_parser import parse_st
+
+BOOL_TYPES = {"BOOL"}
+BIT_TYPES = {"BYTE", "WORD", "DWORD", "LWORD"}
+INT_TYPES = {"SINT", "INT", "DINT", "LINT", "USINT", "UINT", "UDINT", "ULINT"}
+REAL_TYPES = {"REAL", "LREAL"}
+
+LOGICAL_OPS = {"AND", "&", "OR", "XOR"}
+COMPARISON_OPS = {"=", "<>", "<", ">", "<=", ">="}
+ARITHMETIC_OPS = {"+", "-", "*", "/", "MOD", "**"}
+
+CONVERSION_RE = re.compile(r"^\w+_TO_(\w+)$", re.IGNORECASE)
+REAL_FUNCTIONS = {"SQRT", "LN", "LOG", "EXP", "SIN", "COS", "TAN", "ASIN", "ACOS", "ATAN", "EXPT"}
+
+
+def type_class(type_name):
+    """"BOOL", "BIT", "INT", "REAL" or None for other/unknown types"""
+    base = (type_name or "").upper()
+    if " OF " in base:
+        base = base.rsplit(" OF ", 1)[1]
+    base = base.strip()
+    if base in BOOL_TYPES:
+        return "BOOL"
+    if base in BIT_TYPES:
+        return "BIT"
+    if base in INT_TYPES:
+        return "INT"
+    if base in REAL_TYPES:
+        return "REAL"
+    return None
+
+
+def is_input(io_type):
+    """True for "Digital In", "Analog Input" and the like"""
+    words = (io_type or "").lower().split()
+    return bool(words) and words[-1] in ("in", "input")
+
+
+def _diagnostic(severity, code, line, message, tag=""):
+    return {"severity": severity, "code": code, "line": line, "message": message, "tag": tag}
+
+
+class _Checker:
+    """One pass over a program's statements"""
+
+    def __init__(self, program, context):
+        self.diagnostics = []
+        self.symbols = {}
+        for decl in program.declarations():
+            for name in decl.names:
+                self.symbols[name.upper()] = {"tag": name, "type": decl.type, "io_type": "",
+                                              "from_tag_list": False}
+        # Reconciled context wins: it carries the tag list's types and IO types
+        for var in context:
+            tag = var.get("tag", "")
+            if tag:
+                self.symbols[tag.upper()] = {"tag": tag, "type": var.get("type", ""),
+                                             "io_type": var.get("io_type", ""),
+                                             "from_tag_list": var.get("origin") == "tag_list"}
+        self.context_names = [var.get("tag", "") for var in context if var.get("tag")]
+        self.used = set()
+        self.reported = set()
+
+    def report(self, severity, code, line, message, tag=""):
+        self.diagnostics.append(_diagnostic(severity, code, line, message, tag))
+
+    def run(self, program):
+        for error in program.errors:
+            self.report("error", "syntax", error["line"], error["message"])
+        self.statements(program.statements)
+        if program.errors:
+            # Statements lost to syntax errors would show up as unused
+            return self.diagnostics
+        for tag in self.context_names:
+            if tag.upper() not in self.used:
+                self.report("warning", "unused", None, f"'{tag}' is declared but never used", tag)
+        return self.diagnostics
+
+    # ----- statements -----
+    def statements(self, nodes):
+        for node in nodes:
+            handler = getattr(self, "stmt_" + node.kind, None)
+            if handler is not None:
+                handler(node)
+
+    def stmt_assign(self, node):
+        target = self.expression(node.target, write=True)
+        value = self.expression(node.value)
+        name = node.target.id if node.target.kind == "name" else ""
+        if target == "BOOL" and value in ("INT", "REAL"):
+            self.report("error", "type", node.line, f"{value} value assigned to BOOL '{name}'", name)
+        elif target in ("INT", "REAL") and value == "BOOL":
+            self.report("error", "type", node.line, f"BOOL value assigned to {target} '{name}'", name)
+        elif target == "INT" and value == "REAL":
+            self.report("warning", "type", node.line,
+                        f"REAL value assigned to integer '{name}' without conversion", name)
+
+    def stmt_call_statement(self, node):
+        self.expression(node.call)
+
+    def stmt_if(self, node):
+        for condition, body in node.branches:
+            self.condition(condition, "IF")
+            self.statements(body)
+        self.statements(node.else_body)
+
+    def stmt_case(self, node):
+        self.expression(node.selector)
+        for _, body in node.cases:
+            self.statements(body)
+        self.statements(node.else_body)
+
+    def stmt_for(self, node):
+        self.expression(node.var, write=True)
+        for bound in (node.start, node.end, node.step):
+            if bound is not None and self.expression(bound) == "BOOL":
+                self.report("error", "type", bound.line, "FOR bounds must be numeric, not BOOL")
+        self.statements(node.body)
+
+    def stmt_while(self, node):
+        self.condition(node.condition, "WHILE")
+        self.statements(node.body)
+
+    def stmt_repeat(self, node):
+        self.statements(node.body)
+        self.condition(node.condition, "UNTIL")
+
+    def condition(self, node, keyword):
+        kind = self.expression(node)
+        if kind in ("INT", "REAL"):
+            self.report("error", "type", node.line, f"{keyword} condition is {kind}, expected BOOL")
+
+    # ----- expressions -----
+    def expression(self, node, write=False):
+        """Type class of the expression; records uses and checks operands"""
+        kind = node.kind
+        if kind == "name":
+            return self.name(node, write)
+        if kind == "literal":
+            return type_class(node.type)
+        if kind in ("member", "deref"):
+            self.expression(node.base, write)
+            return None
+        if kind == "index":
+            base = self.expression(node.base, write)
+            for index in node.indices:
+                self.expression(index)
+            return base
+        if kind == "call":
+            return self.call(node)
+        if kind == "unary":
+            return self.unary(node)
+        if kind == "binary":
+            return self.binary(node)
+        return None
+
+    def name(self, node, write):
+        key = node.id.upper()
+        symbol = self.symbols.get(key)
+        self.used.add(key)
+        if symbol is None:
+            if key not in self.reported:
+                self.reported.add(key)
+                self.report("error", "undeclared", node.line, f"'{node.id}' is not declared", node.id)
+            return None
+        if write and symbol["from_tag_list"] and is_input(symbol["io_type"]):
+            self.report("error", "input_write", node.line,
+                        f"'{symbol['tag']}' is an input ({symbol['io_type']}) and cannot be written", symbol["tag"])
+        return type_class(symbol["type"])
+
+    def call(self, node):
+        callee = node.callee.upper()
+        if callee in self.symbols:
+            # Function block instance: inputs are read, `=>` outputs are written
+            self.used.add(callee)
+        for arg in node.args:
+            self.expression(arg["value"], write=arg["output"])
+        conversion = CONVERSION_RE.match(callee)
+        if conversion:
+            return type_class(conversion.group(1))
+        if callee in REAL_FUNCTIONS:
+            return "REAL"
+        return None
+
+    def unary(self, node):
+        operand = self.expression(node.operand)
+        if node.op == "NOT":
+            if operand in ("INT", "REAL"):
+                self.report("error", "type", node.line, f"NOT applied to {operand} value")
+                return "BOOL"
+            return operand
+        if operand == "BOOL":
+            self.report("error", "type", node.line, f"Unary '{node.op}' applied to BOOL value")
+            return None
+        return operand
+
+    def binary(self, node):
+        left = self.expression(node.left)
+        right = self.expression(node.right)
+        op = node.op
+        if op in LOGICAL_OPS:
+            for side in (left, right):
+                if side in ("INT", "REAL"):
+                    self.report("error", "type", node.line, f"{op} applied to {side} value")
+            return "BIT" if "BIT" in (left, right) else "BOOL"
+        if op in COMPARISON_OPS:
+            if {left, right} in ({"BOOL", "INT"}, {"BOOL", "REAL"}):
+                self.report("error", "type", node.line, f"BOOL compared with {left if right == 'BOOL' else right}")
+            return "BOOL"
+        if op in ARITHMETIC_OPS:
+            if "BOOL" in (left, right):
+                self.report("error", "type", node.line, f"Arithmetic '{op}' applied to BOOL value")
+                return None
+            if "REAL" in (left, right):
+                return "REAL"
+            if left == right:
+                return left
+        return None
+
+
+def check_program(program, context):
+    """Diagnostics for a parsed program, sorted by line"""
+    diagnostics = _Checker(program, context).run(program)
+    diagnostics.sort(key=lambda d: (d["line"] is None, d["line"] or 0))
+    return diagnostics
+
+
+def check_key(st_code, context):
+    """Hash of the code and the context fields the checks depend on"""
+    fields = [(v.get("tag", ""), v.get("type", ""), v.get("io_type", ""), v.get("origin", ""))
+              for v in context]
+    payload = st_code + "\0" + json.dumps(fields)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class STChecker:
+    """check_program with an LRU of results keyed by check_key.
+
+    Regenerating the same request (or a cached model response) gives the
+    same code and context, so repeats cost a hash instead of a parse.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check(self, st_code, context, program=None):
+        key = check_key(st_code, context)
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        if program is None:
+            program = parse_st(st_code)
+        diagnostics = check_program(program, context)
+        with self._lock:
+            self._results[key] = diagnostics
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return diagnostics
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._results)}
@@ -0,0 +1,764 @@
+"""Incremental tokenizer and parser for IEC 61131-3 Structured Text.
+
+    parser = STParser()
+    for chunk in chunks:
+        parser.feed(chunk)      # declarations/statements appear as they complete
+    program = parser.close()
+
+parse_st(text) does the same for a complete string. Each token is scanned
+once by the lexer and once by the parser, so parsing is linear in the
+input. Syntax errors are recorded on the program instead of raised; the
+parser resynchronises at the next statement.
+"""
+import re
+
+TOKEN_RE = re.compile(r"""
+    [ \t\r\n]*
+    (?:
+        (?P<word>[A-Za-z_][A-Za-z0-9_]*(?:\#[A-Za-z0-9_.:\-]*)?)
+      | (?P<number>\d[\d_]*(?:\#[0-9A-Fa-f_]+|(?:\.\d[\d_]*)?(?:[eE][+\-]?\d+)?))
+      | (?P<comment>\(\*.*?\*\)|/\*.*?\*/|//[^\n]*)
+      | (?P<open_comment>\(\*|/\*)
+      | (?P<string>'(?:\$.|[^'$])*'|"(?:\$.|[^"$])*")
+      | (?P<open_string>['"])
+      | (?P<fence>```[^\n]*)
+      | (?P<address>%[IQM][XBWDL]?[\d.]+)
+      | (?P<op>:=|=>|<=|>=|<>|\*\*|\.\.|[-+*/=<>&:;,.()\[\]^])
+      | (?P<other>\S)
+    )
+""", re.VERBOSE | re.DOTALL)
+
+# Tokens ending this close to the end of a chunk are held back: a longer
+# match (1.5, 1e3, 16#FF, %IX0) may only be visible with more text
+LOOKAHEAD = 4
+
+VAR_KEYWORDS = {"VAR", "VAR_INPUT", "VAR_OUTPUT", "VAR_IN_OUT", "VAR_GLOBAL", "VAR_EXTERNAL",
+                "VAR_TEMP", "VAR_STAT", "VAR_INST", "VAR_CONFIG", "VAR_ACCESS"}
+VAR_QUALIFIERS = {"CONSTANT", "RETAIN", "NON_RETAIN", "PERSISTENT"}
+POU_KEYWORDS = {"PROGRAM", "FUNCTION_BLOCK", "FUNCTION"}
+POU_END = {"END_PROGRAM", "END_FUNCTION_BLOCK", "END_FUNCTION"}
+BLOCK_OPEN = {"IF": "END_IF", "CASE": "END_CASE", "FOR": "END_FOR", "WHILE": "END_WHILE",
+              "REPEAT": "END_REPEAT"}
+BLOCK_CLOSE = set(BLOCK_OPEN.values())
+
+# Binary operators from loosest to tightest binding
+PRECEDENCE = [("OR",), ("XOR",), ("AND", "&"), ("=", "<>"), ("<", ">", "<=", ">="),
+              ("+", "-"), ("*", "/", "MOD"), ("**",)]
+BINARY_PRECEDENCE = {op: level + 1 for level, ops in enumerate(PRECEDENCE) for op in ops}
+
+TYPED_LITERAL_PREFIX = {
+    "T": "TIME", "TIME": "TIME", "LT": "LTIME", "LTIME": "LTIME",
+    "D": "DATE", "DATE": "DATE", "TOD": "TOD", "TIME_OF_DAY": "TOD",
+    "DT": "DT", "DATE_AND_TIME": "DT",
+}
+
+WORD_KINDS = {"ident", "number", "typed", "string", "address"}
+
+
+class Token:
+    __slots__ = ("kind", "text", "upper", "start", "end", "line")
+
+    def __init__(self, kind, text, start, end, line):
+        self.kind = kind
+        self.text = text
+        self.upper = text.upper() if kind == "ident" else text
+        self.start = start
+        self.end = end
+        self.line = line
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.text!r}, line {self.line})"
+
+
+class Lexer:
+    """Turns text fed in arbitrary chunks into tokens.
+
+    A token that might continue in the next chunk (anything within
+    LOOKAHEAD characters of the end, an unterminated comment or string) is
+    held back until more text arrives or close() is called.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._offset = 0
+        self._line = 1
+
+    def feed(self, chunk):
+        self._buf += chunk
+        return self._scan(final=False)
+
+    def close(self):
+        return self._scan(final=True)
+
+    def _scan(self, final):
+        buf = self._buf
+        n = len(buf)
+        limit = n if final else n - LOOKAHEAD
+        offset = self._offset
+        pos = 0
+        line = self._line
+        tokens = []
+        for m in TOKEN_RE.finditer(buf):
+            kind = m.lastgroup
+            start = m.start(kind)
+            end = m.end()
+            if end > limit or (kind in ("open_comment", "open_string") and not final):
+                break
+            if kind == "open_comment":
+                # Unterminated comment at end of input
+                kind, end = "comment", n
+            elif kind == "open_string":
+                kind = "other"
+            elif kind == "word":
+                kind = "typed" if "#" in m.group(kind) else "ident"
+            elif kind == "number" and "#" in m.group(kind):
+                kind = "typed"
+            text = buf[start:end]
+            line += buf.count("\n", pos, start)
+            tokens.append(Token(kind, text, offset + start, offset + end, line))
+            if kind in ("comment", "string"):
+                line += text.count("\n")
+            pos = end
+            if end == n:
+                break
+        if final:
+            line += buf.count("\n", pos, n)
+            pos = n
+        self._buf = buf[pos:]
+        self._offset = offset + pos
+        self._line = line
+        return tokens
+
+
+class STSyntaxError(Exception):
+    def __init__(self, message, line):
+        super().__init__(message)
+        self.line = line
+
+
+class Node:
+    """AST node: `kind` plus kind-specific attributes"""
+
+    def __init__(self, kind, line, **fields):
+        self.kind = kind
+        self.line = line
+        self.__dict__.update(fields)
+
+    def to_dict(self):
+        return {key: _to_plain(value) for key, value in self.__dict__.items()}
+
+    def __repr__(self):
+        fields = ", ".join(f"{k}={v!r}" for k, v in self.__dict__.items() if k not in ("kind", "line"))
+        return f"{self.kind}({fields})"
+
+
+def _to_plain(value):
+    if isinstance(value, Node):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [_to_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _to_plain(v) for k, v in value.items()}
+    return value
+
+
+class VarDecl:
+    """One declaration; `a, b : BOOL;` yields a single VarDecl with two names"""
+
+    def __init__(self, names, type, section, line, initial_value="", init=None, comment="", address=""):
+        self.names = names
+        self.type = type
+        self.section = section
+        self.line = line
+        self.initial_value = initial_value
+        self.init = init
+        self.comment = comment
+        self.address = address
+
+    def to_dict(self):
+        return {"names": self.names, "type": self.type, "section": self.section, "line": self.line,
+                "initial_value": self.initial_value, "comment": self.comment, "address": self.address}
+
+
+class VarSection:
+    def __init__(self, kind, start, line):
+        self.kind = kind
+        self.qualifiers = []
+        self.declarations = []
+        self.start = start
+        self.end = None
+        self.line = line
+
+    @property
+    def closed(self):
+        return self.end is not None
+
+    def to_dict(self):
+        return {"kind": self.kind, "qualifiers": self.qualifiers, "line": self.line,
+                "declarations": [d.to_dict() for d in self.declarations]}
+
+
+class Program:
+    """Parse result: POU header, VAR sections, statements and errors"""
+
+    def __init__(self):
+        self.pou_kind = ""
+        self.name = ""
+        self.return_type = ""
+        self.var_sections = []
+        self.statements = []
+        self.errors = []
+        self.logic_start = None
+        self.logic_end = None
+
+    def declarations(self):
+        return [decl for section in self.var_sections for decl in section.declarations]
+
+    def error(self, message, line):
+        self.errors.append({"line": line, "message": message})
+
+    def to_dict(self):
+        return {
+            "pou_kind": self.pou_kind,
+            "name": self.name,
+            "return_type": self.return_type,
+            "var_sections": [s.to_dict() for s in self.var_sections],
+            "statements": [s.to_dict() for s in self.statements],
+            "errors": self.errors,
+        }
+
+
+def comment_text(token):
+    text = token.text
+    if text.startswith("//"):
+        text = text[2:]
+    else:
+        text = text[2:-2] if text.endswith(("*)", "*/")) else text[2:]
+    return " ".join(text.split())
+
+
+def join_tokens(tokens):
+    """Source-like text for a token run, e.g. ARRAY[1..10] OF REAL"""
+    out = []
+    prev = None
+    for tok in tokens:
+        if prev is not None and (
+                (prev.kind in WORD_KINDS and tok.kind in WORD_KINDS)
+                or prev.text == "," or tok.upper in ("OF", "TO") or prev.upper in ("OF", "TO")):
+            out.append(" ")
+        out.append(tok.text)
+        prev = tok
+    return "".join(out)
+
+
+def literal_type(tok):
+    """IEC type of a number or typed literal token"""
+    if tok.kind == "typed":
+        prefix = tok.text.split("#", 1)[0].upper()
+        if prefix.isdigit():
+            return "INT"
+        return TYPED_LITERAL_PREFIX.get(prefix, prefix)
+    if "." in tok.text or "e" in tok.text.lower():
+        return "REAL"
+    return "INT"
+
+
+class STParser:
+    """Incremental parser; feed() text as it arrives and close() at the end"""
+
+    def __init__(self):
+        self.lexer = Lexer()
+        self.program = Program()
+        self._section = None
+        self._decl = []
+        self._decl_comments = []
+        self._lead_comment = None
+        self._last_decl = None
+        self._last_decl_line = None
+        self._stmt = []
+        self._depth = 0
+        self._block_closed = False
+        self._header = None
+
+    def feed(self, chunk):
+        for tok in self.lexer.feed(chunk):
+            self._push(tok)
+        return self.program
+
+    def close(self):
+        for tok in self.lexer.close():
+            self._push(tok)
+        if self._section is not None:
+            if self._decl:
+                self._finish_decl(self._decl[-1])
+            self.program.error(f"{self._section.kind} section not closed with END_VAR", self._section.line)
+            self._section = None
+        if self._stmt:
+            self._flush_statement()
+        return self.program
+
+    # ----- token dispatch -----
+    def _push(self, tok):
+        if tok.kind == "comment":
+            self._push_comment(tok)
+            return
+        if tok.kind == "fence":
+            return
+        if self._section is not None:
+            self._push_declaration_token(tok)
+            return
+        if self._header is not None and self._push_header(tok):
+            return
+
+        upper = tok.upper
+        if self._block_closed:
+            self._block_closed = False
+            if tok.text == ";":
+                self._stmt.append(tok)
+                self._flush_statement()
+                return
+            self._flush_statement()
+
+        if tok.kind == "ident" and self._depth == 0 and (upper in VAR_KEYWORDS or upper in POU_KEYWORDS
+                                                         or upper in POU_END):
+            if self._stmt:
+                self._flush_statement()
+            if upper in VAR_KEYWORDS:
+                self._section = VarSection(upper, tok.start, tok.line)
+                self.program.var_sections.append(self._section)
+            elif upper in POU_KEYWORDS:
+                self.program.pou_kind = upper
+                self._header = "name"
+            return
+
+        self._stmt.append(tok)
+        if tok.kind == "ident":
+            if upper in BLOCK_OPEN:
+                self._depth += 1
+            elif upper in BLOCK_CLOSE:
+                self._depth = max(0, self._depth - 1)
+                if self._depth == 0:
+                    self._block_closed = True
+        elif tok.text == ";" and self._depth == 0:
+            self._flush_statement()
+
+    def _push_header(self, tok):
+        """Consume `PROGRAM name` / `FUNCTION name : type`; False once the header is over"""
+        if self._header == "name" and tok.kind == "ident":
+            self.program.name = tok.text
+            self._header = "colon" if self.program.pou_kind == "FUNCTION" else None
+            return True
+        if self._header == "colon" and tok.text == ":":
+            self._header = "type"
+            return True
+        if self._header == "type" and tok.kind == "ident":
+            self.program.return_type = tok.text
+            self._header = None
+            return True
+        self._header = None
+        return False
+
+    def _push_comment(self, tok):
+        if self._section is None:
+            return
+        if self._decl:
+            self._decl_comments.append(tok)
+        elif self._last_decl is not None and tok.line == self._last_decl_line:
+            # Trailing comment on the declaration's line takes precedence
+            self._last_decl.comment = comment_text(tok)
+        else:
+            self._lead_comment = tok
+
+    def _push_declaration_token(self, tok):
+        section = self._section
+        if tok.kind == "ident" and tok.upper == "END_VAR":
+            if self._decl:
+                self.program.error("Declaration is missing ';'", self._decl[0].line)
+                self._finish_decl(tok)
+            section.end = tok.end
+            self._section = None
+            self._last_decl = None
+            self._lead_comment = None
+            return
+        if (tok.kind == "ident" and tok.upper in VAR_QUALIFIERS
+                and not section.declarations and not self._decl):
+            section.qualifiers.append(tok.upper)
+            return
+        if tok.text == ";":
+            self._finish_decl(tok)
+            return
+        self._decl.append(tok)
+
+    def _finish_decl(self, end_tok):
+        tokens, self._decl = self._decl, []
+        comments, self._decl_comments = self._decl_comments, []
+        lead, self._lead_comment = self._lead_comment, None
+        if not tokens:
+            return
+        try:
+            decl = parse_declaration(tokens, self._section.kind)
+        except STSyntaxError as e:
+            self.program.error(str(e), e.line)
+            self._last_decl = None
+            return
+        if comments:
+            decl.comment = comment_text(comments[0])
+        elif lead is not None and lead.line >= tokens[0].line - 1:
+            decl.comment = comment_text(lead)
+        self._section.declarations.append(decl)
+        self._last_decl = decl
+        self._last_decl_line = end_tok.line
+
+    def _flush_statement(self):
+        tokens, self._stmt = self._stmt, []
+        self._depth = 0
+        self._block_closed = False
+        if not tokens:
+            return
+        program = self.program
+        if program.logic_start is None:
+            program.logic_start = tokens[0].start
+        program.logic_end = tokens[-1].end
+
+        stream = TokenStream(tokens)
+        while not stream.at_end():
+            start = stream.pos
+            try:
+                node = parse_statement(stream)
+            except STSyntaxError as e:
+                program.error(str(e), e.line)
+                program.statements.append(Node("error", tokens[start].line,
+                                               text=join_tokens(tokens[start:]), message=str(e)))
+                return
+            if node is not None:
+                program.statements.append(node)
+
+
+# ----- recursive descent over a complete statement -----
+class TokenStream:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def at_end(self):
+        return self.pos >= len(self.tokens)
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def peek_upper(self):
+        tok = self.peek()
+        return tok.upper if tok is not None else None
+
+    def next(self):
+        tok = self.peek()
+        if tok is None:
+            last = self.tokens[-1] if self.tokens else None
+            raise STSyntaxError("Unexpected end of statement", last.line if last else 0)
+        self.pos += 1
+        return tok
+
+    def accept(self, upper):
+        tok = self.peek()
+        if tok is not None and tok.upper == upper:
+            self.pos += 1
+            return tok
+        return None
+
+    def expect(self, upper):
+        tok = self.peek()
+        if tok is None or tok.upper != upper:
+            found = repr(tok.text) if tok is not None else "end of statement"
+            line = tok.line if tok is not None else (self.tokens[-1].line if self.tokens else 0)
+            raise STSyntaxError(f"Expected {upper} but found {found}", line)
+        self.pos += 1
+        return tok
+
+
+def parse_declaration(tokens, section):
+    """names [AT %addr] : type [:= initial value]"""
+    stream = TokenStream(tokens)
+    first = stream.peek()
+    names = []
+    while True:
+        tok = stream.next()
+        if tok.kind != "ident":
+            raise STSyntaxError(f"Expected a variable name but found {tok.text!r}", tok.line)
+        names.append(tok.text)
+        if not stream.accept(","):
+            break
+    address = ""
+    if stream.accept("AT"):
+        address = stream.next().text
+    stream.expect(":")
+
+    type_tokens = []
+    depth = 0
+    while not stream.at_end():
+        tok = stream.peek()
+        if tok.text in ("[", "("):
+            depth += 1
+        elif tok.text in ("]", ")"):
+            depth -= 1
+        elif tok.text == ":=" and depth == 0:
+            break
+        type_tokens.append(stream.next())
+    if not type_tokens:
+        raise STSyntaxError(f"Missing type for {', '.join(names)}", first.line)
+
+    initial_value, init = "", None
+    if stream.accept(":="):
+        init_tokens = stream.tokens[stream.pos:]
+        initial_value = join_tokens(init_tokens)
+        try:
+            init = parse_expression(TokenStream(init_tokens))
+        except STSyntaxError:
+            init = None  # array/struct initialisers are kept as text
+    return VarDecl(names, join_tokens(type_tokens), section, first.line,
+                   initial_value=initial_value, init=init, address=address)
+
+
+def parse_statement_list(stream, stop, case_body=False):
+    statements = []
+    while not stream.at_end() and stream.peek_upper() not in stop:
+        if case_body and at_case_label(stream):
+            break
+        node = parse_statement(stream)
+        if node is not None:
+            statements.append(node)
+    return statements
+
+
+def at_case_label(stream):
+    """True if the stream is at `label[, label] :` (as opposed to a statement)"""
+    i = 0
+    while True:
+        tok = stream.peek(i)
+        if tok is None:
+            return False
+        if tok.text == ":":
+            return i > 0
+        if tok.kind in ("number", "typed", "ident") or tok.text in ("-", ",", ".."):
+            i += 1
+            continue
+        return False
+
+
+def parse_statement(stream):
+    tok = stream.peek()
+    upper = tok.upper
+    if tok.text == ";":
+        stream.next()
+        return None
+    if tok.kind == "ident":
+        if upper == "IF":
+            return parse_if(stream)
+        if upper == "CASE":
+            return parse_case(stream)
+        if upper == "FOR":
+            return parse_for(stream)
+        if upper == "WHILE":
+            return parse_while(stream)
+        if upper == "REPEAT":
+            return parse_repeat(stream)
+        if upper in ("EXIT", "CONTINUE", "RETURN"):
+            stream.next()
+            stream.accept(";")
+            return Node(upper.lower(), tok.line)
+
+    target = parse_expression(stream)
+    if stream.accept(":="):
+        value = parse_expression(stream)
+        node = Node("assign", tok.line, target=target, value=value)
+    elif target.kind == "call":
+        node = Node("call_statement", tok.line, call=target)
+    else:
+        raise STSyntaxError("Expected ':=' or a call", tok.line)
+    if not stream.accept(";") and not stream.at_end():
+        nxt = stream.peek()
+        raise STSyntaxError(f"Expected ';' but found {nxt.text!r}", nxt.line)
+    return node
+
+
+def parse_if(stream):
+    line = stream.expect("IF").line
+    branches = []
+    condition = parse_expression(stream)
+    stream.expect("THEN")
+    branches.append((condition, parse_statement_list(stream, {"ELSIF", "ELSE", "END_IF"})))
+    while stream.accept("ELSIF"):
+        condition = parse_expression(stream)
+        stream.expect("THEN")
+        branches.append((condition, parse_statement_list(stream, {"ELSIF", "ELSE", "END_IF"})))
+    else_body = parse_statement_list(stream, {"END_IF"}) if stream.accept("ELSE") else []
+    stream.expect("END_IF")
+    stream.accept(";")
+    return Node("if", line, branches=branches, else_body=else_body)
+
+
+def parse_case(stream):
+    line = stream.expect("CASE").line
+    selector = parse_expression(stream)
+    stream.expect("OF")
+    cases = []
+    while not stream.at_end() and stream.peek_upper() not in ("ELSE", "END_CASE"):
+        labels = []
+        while True:
+            low = parse_expression(stream)
+            labels.append((low, parse_expression(stream)) if stream.accept("..") else (low, None))
+            if not stream.accept(","):
+                break
+        stream.expect(":")
+        cases.append((labels, parse_statement_list(stream, {"ELSE", "END_CASE"}, case_body=True)))
+    else_body = parse_statement_list(stream, {"END_CASE"}) if stream.accept("ELSE") else []
+    stream.expect("END_CASE")
+    stream.accept(";")
+    return Node("case", line, selector=selector, cases=cases, else_body=else_body)
+
+
+def parse_for(stream):
+    line = stream.expect("FOR").line
+    var = stream.next()
+    if var.kind != "ident":
+        raise STSyntaxError("Expected a loop variable after FOR", var.line)
+    stream.expect(":=")
+    start = parse_expression(stream)
+    stream.expect("TO")
+    end = parse_expression(stream)
+    step = parse_expression(stream) if stream.accept("BY") else None
+    stream.expect("DO")
+    body = parse_statement_list(stream, {"END_FOR"})
+    stream.expect("END_FOR")
+    stream.accept(";")
+    return Node("for", line, var=Node("name", var.line, id=var.text), start=start, end=end,
+                step=step, body=body)
+
+
+def parse_while(stream):
+    line = stream.expect("WHILE").line
+    condition = parse_expression(stream)
+    stream.expect("DO")
+    body = parse_statement_list(stream, {"END_WHILE"})
+    stream.expect("END_WHILE")
+    stream.accept(";")
+    return Node("while", line, condition=condition, body=body)
+
+
+def parse_repeat(stream):
+    line = stream.expect("REPEAT").line
+    body = parse_statement_list(stream, {"UNTIL"})
+    stream.expect("UNTIL")
+    condition = parse_expression(stream)
+    stream.expect("END_REPEAT")
+    stream.accept(";")
+    return Node("repeat", line, condition=condition, body=body)
+
+
+def parse_expression(stream, min_precedence=1):
+    """Precedence climbing over BINARY_PRECEDENCE"""
+    left = parse_unary(stream)
+    while True:
+        tok = stream.peek()
+        precedence = BINARY_PRECEDENCE.get(tok.upper) if tok is not None else None
+        if precedence is None or precedence < min_precedence:
+            return left
+        stream.next()
+        right = parse_expression(stream, precedence + 1)
+        left = Node("binary", tok.line, op=tok.upper, left=left, right=right)
+
+
+def parse_unary(stream):
+    tok = stream.peek()
+    if tok is not None and tok.upper in ("NOT", "-", "+"):
+        stream.next()
+        return Node("unary", tok.line, op=tok.upper, operand=parse_unary(stream))
+    return parse_primary(stream)
+
+
+def parse_primary(stream):
+    tok = stream.next()
+    if tok.text == "(":
+        node = parse_expression(stream)
+        stream.expect(")")
+        return node
+    if tok.kind in ("number", "typed"):
+        if tok.kind == "typed" and tok.text.split("#", 1)[0].upper() == "BOOL":
+            return Node("literal", tok.line, type="BOOL", value=tok.text)
+        return Node("literal", tok.line, type=literal_type(tok), value=tok.text)
+    if tok.kind == "string":
+        return Node("literal", tok.line, type="STRING", value=tok.text)
+    if tok.kind == "address":
+        return Node("address", tok.line, value=tok.text)
+    if tok.kind != "ident" or tok.upper in BLOCK_CLOSE or tok.upper in ("THEN", "DO", "OF", "ELSE"):
+        raise STSyntaxError(f"Unexpected {tok.text!r}", tok.line)
+    if tok.upper in ("TRUE", "FALSE"):
+        return Node("literal", tok.line, type="BOOL", value=tok.upper)
+
+    node = Node("name", tok.line, id=tok.text)
+    while True:
+        if stream.accept("."):
+            member = stream.next()
+            node = Node("member", member.line, base=node, member=member.text)
+        elif stream.accept("["):
+            indices = [parse_expression(stream)]
+            while stream.accept(","):
+                indices.append(parse_expression(stream))
+            stream.expect("]")
+            node = Node("index", tok.line, base=node, indices=indices)
+        elif stream.accept("^"):
+            node = Node("deref", tok.line, base=node)
+        elif stream.peek_upper() == "(" and node.kind == "name":
+            stream.next()
+            node = Node("call", tok.line, callee=node.id, args=parse_arguments(stream))
+        else:
+            return node
+
+
+def parse_arguments(stream):
+    """Call arguments as [{name, value, output}]; positional arguments have name None"""
+    args = []
+    if stream.accept(")"):
+        return args
+    while True:
+        first, second = stream.peek(), stream.peek(1)
+        if first is not None and first.kind == "ident" and second is not None and second.text in (":=", "=>"):
+            stream.next()
+            output = stream.next().text == "=>"
+            args.append({"name": first.text, "value": parse_expression(stream), "output": output})
+        else:
+            args.append({"name": None, "value": parse_expression(stream), "output": False})
+        if not stream.accept(","):
+            break
+    stream.expect(")")
+    return args
+
+
+def parse_st(text):
+    """Parse a complete ST text"""
+    parser = STParser()
+    parser.feed(text)
+    return parser.close()
+
+
+def declared_variables(program):
+    """Declarations flattened to one dict per name, in the /api/generate context shape
+
+    "section" is the section header with its qualifiers, e.g. "VAR_INPUT"
+    or "VAR CONSTANT".
+    """
+    variables = []
+    for section in program.var_sections:
+        header = " ".join([section.kind] + section.qualifiers)
+        for decl in section.declarations:
+            for name in decl.names:
+                variables.append({
+                    "tag": name,
+                    "io_type": "Internal",  # Will be enhanced later
+                    "description": decl.comment,
+                    "type": decl.type,
+                    "tank": "",
+                    "section": header,
+                    "initial_value": decl.initial_value
+                })
+    return variables
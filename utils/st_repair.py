@@ -0,0 +1,141 @@
+"""Detect malformed generated ST and patch it with small, diff-only edits.
+
+A repair reply holds only the changes: a VAR ... END_VAR block with the
+missing declarations and/or `LINE <n>: <text>` replacements for broken
+lines. ST is free-format, so a one-line replacement can also insert
+statements (e.g. `LINE 4: x : BOOL; END_VAR`).
+"""
+import re
+
+from utils.st_checker import check_program
+from utils.st_parser import parse_st, declared_variables
+
+REPAIR_LINE_RE = re.compile(r"^\s*LINE\s+(\d+)\s*:[ \t]?(.*)$", re.MULTILINE | re.IGNORECASE)
+
+# Markdown code blocks; an unterminated block (cut-off reply) runs to the end
+FENCE_BLOCK_RE = re.compile(r"^[ \t]*```[^\n]*\n(.*?)(?:^[ \t]*```[^\n]*$|\Z)", re.MULTILINE | re.DOTALL)
+# Keywords are matched in upper case only so prose ("If the level...") is not taken for code
+CODE_START_RE = re.compile(
+    r"^[ \t]*(?:VAR(?:_[A-Z_]+)?\b|(?:PROGRAM|FUNCTION_BLOCK|FUNCTION|IF|CASE|FOR|WHILE)\s|REPEAT\b"
+    r"|\(\*|[A-Za-z_]\w*(?:\.\w+|\[[^\]\n]*\])*\s*(?::=|\())",
+    re.MULTILINE)
+CODE_END_RE = re.compile(r"(?:;|\bEND_[A-Z_]+|\*\))[ \t]*(?:\(\*.*?\*\)|//[^\n]*)?[ \t]*$", re.MULTILINE)
+
+
+def extract_code(text):
+    """The ST inside a model reply, without prose around it, or None if there is none
+
+    Fenced blocks are taken when present; otherwise (and within them) the
+    code runs from the first line that starts like ST to the last line
+    that ends like ST.
+    """
+    blocks = FENCE_BLOCK_RE.findall(text)
+    if blocks:
+        text = "\n".join(blocks)
+    start = CODE_START_RE.search(text)
+    if start is None:
+        return None
+    end = None
+    for end in CODE_END_RE.finditer(text, start.start()):
+        pass
+    return text[start.start():end.end() if end else len(text)].strip()
+
+
+def find_repair_issues(program):
+    """What makes a parsed program unusable, or None if nothing does
+
+    {"missing_var": no VAR section at all, "syntax": parser errors,
+     "undeclared": names used but not declared}
+    """
+    undeclared = [d["tag"] for d in check_program(program, declared_variables(program))
+                  if d["code"] == "undeclared"]
+    issues = {
+        "missing_var": not program.var_sections,
+        "syntax": list(program.errors),
+        "undeclared": undeclared,
+    }
+    if issues["missing_var"] or issues["syntax"] or issues["undeclared"]:
+        return issues
+    return None
+
+
+def add_declarations(st_code, program, lines):
+    """Insert declaration lines before the first VAR section's END_VAR
+
+    Without any VAR section a new block is put in front of the code.
+    """
+    block = "".join(f"    {line}\n" for line in lines)
+    sections = [s for s in program.var_sections if s.closed]
+    if not sections:
+        return f"VAR\n{block}END_VAR\n\n{st_code.lstrip()}"
+    end_var = sections[0].end - len("END_VAR")
+    prefix = st_code[:end_var]
+    if prefix and not prefix.endswith("\n"):
+        prefix += "\n"
+    return prefix + block + st_code[end_var:]
+
+
+def build_repair_prompt(user_request, st_code, issues):
+    """Compact follow-up prompt: the request, the numbered code and what is wrong"""
+    numbered = "\n".join(f"{n}: {line}" for n, line in enumerate(st_code.split("\n"), 1))
+    problems = [f"- line {e['line']}: {e['message']}" for e in issues["syntax"]]
+    problems += [f"- '{name}' is used but not declared" for name in issues["undeclared"]]
+    problems = "\n".join(problems)
+    return f"""
+REPAIR REQUEST
+The Structured Text below was generated for this request but fails validation.
+
+USER REQUEST:
+{user_request}
+
+GENERATED CODE:
+{numbered}
+
+PROBLEMS:
+{problems}
+
+Reply with ONLY the changes, nothing else:
+- declarations for undeclared names as one VAR ... END_VAR block, one `name : TYPE; (* description *)` per line
+- each corrected line as `LINE <n>: <corrected line>` using the numbers above; one line may hold several statements
+Do not repeat lines that are already correct.
+"""
+
+
+def apply_repair(st_code, program, reply):
+    """Apply a repair reply's line replacements, then its declarations
+
+    Names that are already declared (case-insensitive) or repeated within
+    the reply are skipped, so a repeated reply never declares a tag twice.
+    """
+    lines = st_code.split("\n")
+    for m in REPAIR_LINE_RE.finditer(reply):
+        n = int(m.group(1))
+        if 1 <= n <= len(lines):
+            lines[n - 1] = m.group(2).rstrip()
+    patched = "\n".join(lines)
+    if patched != st_code:
+        program = parse_st(patched)
+    declared = {var["tag"].upper() for var in declared_variables(program)}
+
+    # Only look for declarations outside the LINE replacements
+    reply_program = parse_st(REPAIR_LINE_RE.sub("", reply))
+    declarations = []
+    for section in reply_program.var_sections:
+        for decl in section.declarations:
+            names = []
+            for name in decl.names:
+                if name.upper() not in declared:
+                    declared.add(name.upper())
+                    names.append(name)
+            if not names:
+                continue
+            line = f"{', '.join(names)} : {decl.type}"
+            if decl.initial_value:
+                line += f" := {decl.initial_value}"
+            line += ";"
+            if decl.comment:
+                line += f" (* {decl.comment} *)"
+            declarations.append(line)
+    if not declarations:
+        return patched
+    return add_declarations(patched, program, declarations)
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import pickle
+import threading
+
+FIELDS = ("name", "type", "comment", "tank", "io_type")
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content, read in chunks"""
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def variables_digest(variables):
+    """SHA-256 of a parsed tag list's content, for lists that no file backs (e.g. after a merge)"""
+    h = hashlib.sha256()
+    for var in variables:
+        h.update("\x1f".join(str(var.get(f, "")) for f in FIELDS).encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+class ParsedTagCache:
+    """On-disk cache of parsed tag lists keyed by workbook content hash.
+
+    Entries are stored column-wise (one list per field) as pickles, which
+    keeps them compact and fast to load. The directory is kept under
+    max_bytes by evicting the least recently used entries; a hit refreshes
+    the entry's mtime.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f"{digest}.pkl")
+
+    def get(self, digest):
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as fh:
+                columns = pickle.load(fh)
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        return [dict(zip(FIELDS, row)) for row in zip(*(columns[f] for f in FIELDS))]
+
+    def put(self, digest, variables):
+        columns = {f: [v.get(f, "") for v in variables] for f in FIELDS}
+        path = self._path(digest)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            pickle.dump(columns, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".pkl"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                total -= size
+
+    def get_or_parse(self, path, parser, digest=None):
+        """Return (variables, digest, hit) for the file at path
+
+        Pass `digest` when the content hash is already known to skip rehashing.
+        """
+        if digest is None:
+            digest = file_digest(path)
+        variables = self.get(digest)
+        if variables is not None:
+            return variables, digest, True
+        variables = parser(path)
+        self.put(digest, variables)
+        return variables, digest, False
@@ -0,0 +1,126 @@
+import pandas as pd
+
+from utils.excel_parser import frame_to_variables
+
+# Number of tag names listed per change kind in a diff summary
+DIFF_SAMPLE_SIZE = 100
+
+DELETE_ACTIONS = {"delete", "remove", "del"}
+
+
+def delta_from_frame(df):
+    """Split a delta table into (upserts, deletes).
+
+    Rows use the tag-list columns; an optional `Action` column marks rows
+    to delete ("delete"/"remove"), every other row is an add or update.
+    Delete rows only need a `Tag`.
+    """
+    df = df.rename(columns=lambda x: str(x).strip())
+    if "Action" not in df.columns:
+        return frame_to_variables(df), []
+
+    action = df["Action"].where(df["Action"].notna(), "").astype(str).str.strip().str.lower()
+    is_delete = action.isin(DELETE_ACTIONS)
+    tags = df.loc[is_delete, "Tag"] if "Tag" in df.columns else pd.Series(dtype=object)
+    deletes = [t for t in tags.where(tags.notna(), "").astype(str).str.strip() if t]
+    return frame_to_variables(df[~is_delete]), deletes
+
+
+def delta_from_file(fileobj, filename):
+    """(upserts, deletes) from an uploaded CSV or Excel delta table"""
+    if filename.lower().endswith((".xlsx", ".xls")):
+        return delta_from_frame(pd.read_excel(fileobj, dtype=str))
+    return delta_from_frame(pd.read_csv(fileobj, dtype=str))
+
+
+def delta_from_json(data):
+    """(upserts, deletes) from {"upsert": [rows], "delete": [tags]}
+
+    Upsert rows may use either the tag-list columns (Tag, IO_Type, ...) or
+    the parsed variable keys (name, io_type, ...).
+    """
+    rows = []
+    for row in data.get("upsert", []):
+        if "Tag" in row:
+            rows.append(row)
+        else:
+            rows.append({"Tag": row.get("name"), "IO_Type": row.get("io_type"),
+                         "Description": row.get("comment"), "Tank": row.get("tank")})
+    upserts = frame_to_variables(pd.DataFrame(rows, columns=["Tag", "IO_Type", "Description", "Tank"]))
+    deletes = [str(t).strip() for t in data.get("delete", []) if str(t).strip()]
+    return upserts, deletes
+
+
+def apply_tag_delta(variables, index, upserts=(), deletes=()):
+    """Apply upserts and deletes keyed by tag name.
+
+    All upsert rows sharing a tag name replace that tag's existing rows
+    together, so a tag listed once per tank stays that way, and rows equal
+    to what is stored count as unchanged. `index` is updated one variable
+    at a time instead of being rebuilt. Returns the new variable list
+    (existing order kept, new tags appended) and a diff summary.
+    """
+    slots = {}
+    for pos, var in enumerate(variables):
+        slots.setdefault(var["name"], []).append(pos)
+    groups = {}
+    for var in upserts:
+        groups.setdefault(var["name"], []).append(var)
+
+    replace = {}
+    appended = []
+    added, updated, deleted, not_found = [], [], [], []
+    unchanged = 0
+
+    for name in deletes:
+        positions = slots.pop(name, None)
+        if positions is None:
+            not_found.append(name)
+            continue
+        for pos in positions:
+            replace[pos] = []
+        index.remove_name(name)
+        deleted.append(name)
+
+    for name, rows in groups.items():
+        positions = slots.get(name)
+        if not positions:
+            appended.extend(rows)
+            added.append(name)
+        elif [variables[pos] for pos in positions] == rows:
+            unchanged += 1
+            continue
+        else:
+            replace[positions[0]] = rows
+            for pos in positions[1:]:
+                replace[pos] = []
+            index.remove_name(name)
+            updated.append(name)
+        for var in rows:
+            index.add(var)
+
+    if replace:
+        merged = []
+        for pos, var in enumerate(variables):
+            if pos in replace:
+                merged.extend(replace[pos])
+            else:
+                merged.append(var)
+        merged.extend(appended)
+    else:
+        merged = list(variables) + appended
+
+    summary = {
+        "added": len(added),
+        "updated": len(updated),
+        "deleted": len(deleted),
+        "unchanged": unchanged,
+        "not_found": len(not_found),
+        "changes": {
+            "added": added[:DIFF_SAMPLE_SIZE],
+            "updated": updated[:DIFF_SAMPLE_SIZE],
+            "deleted": deleted[:DIFF_SAMPLE_SIZE],
+            "not_found": not_found[:DIFF_SAMPLE_SIZE],
+        },
+    }
+    return merged, summary
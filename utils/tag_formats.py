@@ -0,0 +1,34 @@
+import importlib.util
+import os
+
+# Leading bytes of the binary formats; anything else is read as CSV
+MAGIC_BYTES = [
+    (b"PK\x03\x04", "excel"),
+    (b"\xd0\xcf\x11\xe0", "excel"),
+    (b"PAR1", "parquet"),
+    (b"ARROW1", "feather"),
+]
+EXTENSIONS = {
+    ".xlsx": "excel", ".xls": "excel", ".csv": "csv", ".txt": "csv",
+    ".parquet": "parquet", ".pq": "parquet", ".feather": "feather", ".arrow": "feather",
+}
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "feather": ("application/vnd.apache.arrow.file", ".feather"),
+}
+
+
+def detect_format(file_path):
+    """Tag-list format from the file's magic bytes, falling back to its extension"""
+    with open(file_path, "rb") as fh:
+        head = fh.read(8)
+    for magic, fmt in MAGIC_BYTES:
+        if head.startswith(magic):
+            return fmt
+    return EXTENSIONS.get(os.path.splitext(file_path)[1].lower(), "csv")
+
+
+def default_export_format():
+    """Parquet when pyarrow is installed, otherwise CSV"""
+    return "parquet" if importlib.util.find_spec("pyarrow") is not None else "csv"
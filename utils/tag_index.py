@@ -0,0 +1,210 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+INDEXED_FIELDS = ("name", "comment", "tank", "io_type")
+
+# Fields that contribute to BM25 relevance ranking
+RANKED_FIELDS = ("name", "comment", "tank")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """Split text into lowercase alphanumeric tokens"""
+    if not text:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+
+class TagIndex:
+    """Inverted index over tag variables.
+
+    Every indexed field keeps its own posting lists (token -> doc ids), so
+    queries can be restricted to e.g. name and comment. Substring lookups
+    ("temp" should hit "temperature") scan the token vocabulary rather than
+    every variable and the resolved token sets are cached per keyword.
+    Variables can be added and removed one at a time without a rebuild.
+    """
+
+    def __init__(self, variables=()):
+        self._docs = {}
+        self._doc_tokens = {}
+        self._postings = {field: defaultdict(set) for field in INDEXED_FIELDS}
+        self._substring_cache = {field: {} for field in INDEXED_FIELDS}
+        self._by_name = defaultdict(set)
+        self._by_lower_name = defaultdict(set)
+        self._doc_len = {}
+        self._total_len = 0
+        self._next_id = 0
+        for var in variables:
+            self.add(var)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def variables(self):
+        """All indexed variables in insertion order"""
+        return list(self._docs.values())
+
+    def add(self, var):
+        doc_id = self._next_id
+        self._next_id += 1
+        self._docs[doc_id] = var
+        self._by_name[var.get("name", "")].add(doc_id)
+        self._by_lower_name[var.get("name", "").lower()].add(doc_id)
+
+        tokens = {}
+        for field in INDEXED_FIELDS:
+            field_tokens = Counter(tokenize(var.get(field, "")))
+            tokens[field] = field_tokens
+            postings = self._postings[field]
+            for token in field_tokens:
+                if token not in postings:
+                    self._register_token(field, token)
+                postings[token].add(doc_id)
+        self._doc_tokens[doc_id] = tokens
+        length = sum(sum(tokens[field].values()) for field in RANKED_FIELDS)
+        self._doc_len[doc_id] = length
+        self._total_len += length
+        return doc_id
+
+    def remove_name(self, name):
+        """Remove every variable whose name equals `name`; returns the count removed"""
+        doomed = self._by_name.pop(name, set())
+        for doc_id in doomed:
+            self._remove(doc_id)
+        return len(doomed)
+
+    def clear(self):
+        self.__init__()
+
+    def _remove(self, doc_id):
+        var = self._docs.pop(doc_id)
+        lower = var.get("name", "").lower()
+        self._by_lower_name[lower].discard(doc_id)
+        if not self._by_lower_name[lower]:
+            del self._by_lower_name[lower]
+        self._total_len -= self._doc_len.pop(doc_id)
+        for field, field_tokens in self._doc_tokens.pop(doc_id).items():
+            postings = self._postings[field]
+            for token in field_tokens:
+                ids = postings[token]
+                ids.discard(doc_id)
+                if not ids:
+                    del postings[token]
+                    self._unregister_token(field, token)
+
+    def _register_token(self, field, token):
+        for keyword, matched in self._substring_cache[field].items():
+            if keyword in token:
+                matched.add(token)
+
+    def _unregister_token(self, field, token):
+        for matched in self._substring_cache[field].values():
+            matched.discard(token)
+
+    def lookup_name(self, name):
+        """First-added variable whose name matches case-insensitively, or None"""
+        ids = self._by_lower_name.get(name.lower())
+        if not ids:
+            return None
+        return self._docs[min(ids)]
+
+    def has_name(self, name):
+        return name.lower() in self._by_lower_name
+
+    def ids_for_token(self, field, text):
+        """Doc ids containing every token of `text` exactly in `field`"""
+        postings = self._postings[field]
+        result = None
+        for token in tokenize(text):
+            ids = postings.get(token, set())
+            result = set(ids) if result is None else result & ids
+            if not result:
+                return set()
+        return result or set()
+
+    def _tokens_containing(self, field, keyword):
+        cache = self._substring_cache[field]
+        if keyword not in cache:
+            cache[keyword] = {token for token in self._postings[field] if keyword in token}
+        return cache[keyword]
+
+    def ids_for_substring(self, field, keyword):
+        """Doc ids whose `field` has a token containing each word of `keyword`"""
+        result = None
+        for word in tokenize(keyword):
+            ids = set()
+            postings = self._postings[field]
+            for token in self._tokens_containing(field, word):
+                ids |= postings[token]
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result or set()
+
+    def match_keywords(self, keywords, fields=("name", "comment")):
+        """Variables matching any keyword in any of `fields`, deduplicated, in insertion order"""
+        hits = set()
+        for keyword in keywords:
+            for field in fields:
+                hits |= self.ids_for_substring(field, keyword)
+        return [self._docs[doc_id] for doc_id in sorted(hits)]
+
+    def rank(self, query, k):
+        """Top-k variables for `query` by BM25 over name/comment/tank, best first"""
+        n_docs = len(self._docs)
+        if not n_docs or k <= 0:
+            return []
+        avg_len = (self._total_len / n_docs) or 1.0
+
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            matched = set()
+            for field in RANKED_FIELDS:
+                matched |= self._postings[field].get(token, set())
+            if not matched:
+                continue
+            idf = math.log(1 + (n_docs - len(matched) + 0.5) / (len(matched) + 0.5))
+            for doc_id in matched:
+                tokens = self._doc_tokens[doc_id]
+                tf = sum(tokens[field][token] for field in RANKED_FIELDS)
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[doc_id] / avg_len)
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self._docs[doc_id] for doc_id, _ in best]
+
+
+class UniqueNameAllocator:
+    """Hands out tag names that clash neither with an index nor with earlier allocations.
+
+    Names are compared case-insensitively. The next numeric suffix is
+    remembered per base name, so repeated clashes on the same base do not
+    re-probe suffixes that are already taken.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self._taken = set()
+        self._next_suffix = {}
+
+    def is_taken(self, name):
+        lower = name.lower()
+        return lower in self._taken or self.index.has_name(lower)
+
+    def allocate(self, base_name):
+        name = base_name
+        if self.is_taken(name):
+            key = base_name.lower()
+            counter = self._next_suffix.get(key, 1)
+            while self.is_taken(f"{base_name}_{counter}"):
+                counter += 1
+            self._next_suffix[key] = counter + 1
+            name = f"{base_name}_{counter}"
+        self._taken.add(name.lower())
+        return name
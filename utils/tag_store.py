@@ -0,0 +1,119 @@
+from collections import Counter, OrderedDict
+
+from utils.tag_index import TagIndex, tokenize
+
+# Scoped (multi-tank or IO-type filtered) indexes kept per store
+SCOPE_CACHE_SIZE = 16
+
+
+class PartitionedTagIndex(TagIndex):
+    """TagIndex that also groups tags by tank.
+
+    Only the doc ids per tank are tracked while tags are added; a tank's
+    sub-index is built on the first request scoped to it and then kept up
+    to date incrementally, so loading a tag list costs one index, not two.
+    A request scoped to one tank is matched and ranked against that tank's
+    partition only. Tags without a tank are plant-wide and are included in
+    every scope. Scopes spanning several tanks or restricted to IO types are
+    built from the tanks' doc ids on first use and cached until the store
+    changes.
+    """
+
+    def __init__(self, variables=()):
+        self._tank_ids = {}
+        self._partitions = {}
+        self._io_counts = {}
+        self._scopes = OrderedDict()
+        super().__init__(variables)
+
+    def add(self, var):
+        doc_id = super().add(var)
+        tank = var.get("tank", "") or ""
+        if tank not in self._tank_ids:
+            self._tank_ids[tank] = set()
+            self._io_counts[tank] = Counter()
+        self._tank_ids[tank].add(doc_id)
+        self._io_counts[tank][var.get("io_type", "") or ""] += 1
+        if tank in self._partitions:
+            self._partitions[tank].add(var)
+        self._scopes.clear()
+        return doc_id
+
+    def _remove(self, doc_id):
+        var = self._docs[doc_id]
+        super()._remove(doc_id)
+        tank = var.get("tank", "") or ""
+        ids = self._tank_ids.get(tank)
+        if ids is not None:
+            ids.discard(doc_id)
+            self._io_counts[tank][var.get("io_type", "") or ""] -= 1
+            partition = self._partitions.get(tank)
+            if partition is not None:
+                partition.remove_name(var.get("name", ""))
+            if not ids:
+                del self._tank_ids[tank]
+                del self._io_counts[tank]
+                self._partitions.pop(tank, None)
+        self._scopes.clear()
+
+    def _partition(self, tank):
+        """Sub-index for one tank, built on first use"""
+        partition = self._partitions.get(tank)
+        if partition is None:
+            partition = TagIndex(self._docs[doc_id] for doc_id in sorted(self._tank_ids[tank]))
+            self._partitions[tank] = partition
+        return partition
+
+    def tank_names(self):
+        """Named tanks in first-seen order (plant-wide tags excluded)"""
+        return [tank for tank in self._tank_ids if tank]
+
+    def tank_summary(self):
+        """[{tank, tags, io_types}] for every tank, plant-wide tags under tank ''"""
+        return [{
+            "tank": tank,
+            "tags": len(ids),
+            "io_types": {io_type: n for io_type, n in self._io_counts[tank].items() if n > 0},
+        } for tank, ids in self._tank_ids.items()]
+
+    def detect_tanks(self, text):
+        """Tanks whose full name appears as a word sequence in `text`"""
+        words = tokenize(text)
+        joined = " " + " ".join(words) + " "
+        found = []
+        for tank in self.tank_names():
+            tank_words = tokenize(tank)
+            if tank_words and " " + " ".join(tank_words) + " " in joined:
+                found.append(tank)
+        return found
+
+    def scoped(self, tanks=None, io_types=None):
+        """Index over the given tanks (plus plant-wide tags) and IO types.
+
+        Unknown tank names are ignored; with no usable tank and no IO type
+        filter the whole store is returned.
+        """
+        tanks = tuple(sorted(t for t in (tanks or ()) if t and t in self._tank_ids))
+        io_types = tuple(sorted(set(io_types or ())))
+        if not tanks and not io_types:
+            return self
+        if len(tanks) == 1 and not io_types and "" not in self._tank_ids:
+            return self._partition(tanks[0])
+
+        key = (tanks, io_types)
+        scope = self._scopes.get(key)
+        if scope is None:
+            if tanks:
+                ids = set().union(*(self._tank_ids[t] for t in tanks), self._tank_ids.get("", ()))
+                candidates = [self._docs[doc_id] for doc_id in sorted(ids)]
+            else:
+                candidates = self.variables()
+            if io_types:
+                candidates = [var for var in candidates if var.get("io_type", "") in io_types]
+            scope = TagIndex(candidates)
+            self._scopes[key] = scope
+            while len(self._scopes) > SCOPE_CACHE_SIZE:
+                self._scopes.popitem(last=False)
+        else:
+            self._scopes.move_to_end(key)
+        return scope
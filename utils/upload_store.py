@@ -0,0 +1,63 @@
+import hashlib
+import os
+import threading
+
+from utils.tag_formats import EXTENSIONS
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the store's max_bytes"""
+
+
+class UploadStore:
+    """Content-addressed storage for uploaded tag lists.
+
+    Uploads are copied from the request stream in chunks, hashed on the way,
+    and stored as <sha256><ext>; a file whose content is already stored is
+    discarded, so duplicate uploads take no extra space. Memory use is one
+    chunk per upload regardless of file size.
+    """
+
+    def __init__(self, directory, max_bytes, chunk_size=1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+
+    def save_stream(self, stream, filename=""):
+        """Store the stream's content; returns (path, digest, size, duplicate)"""
+        ext = os.path.splitext(filename or "")[1].lower()
+        if ext not in EXTENSIONS:
+            ext = ""
+
+        h = hashlib.sha256()
+        size = 0
+        tmp = os.path.join(self.directory, f".upload.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as out:
+                for block in iter(lambda: stream.read(self.chunk_size), b""):
+                    size += len(block)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+                    h.update(block)
+                    out.write(block)
+
+            digest = h.hexdigest()
+            path = os.path.join(self.directory, digest + ext)
+            duplicate = os.path.exists(path)
+            if duplicate:
+                os.remove(tmp)
+            else:
+                os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return path, digest, size, duplicate
+
+    def discard(self, path):
+        """Remove a stored upload that turned out to be unusable"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass